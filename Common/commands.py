@@ -1,11 +1,14 @@
-from Common.constants import BLUE, CONFIG_FILE, CONFIG_PATH, DEFAULT, GREEN, LANGUAGES_PATH, RED
+from Common.constants import BLUE, COMMAND_DEBOUNCE, CONFIG_FILE, CONFIG_PATH, DEFAULT, GREEN, LANGUAGES_PATH, RED
+from Common.devices import peripheral_topic
 from Common.languages import get_kws_path
 from Common.peripherals import peripheral_format
 from Common.positions import position_format
 from Common.rooms import room_format
+from Common.store import get_config, get_config_index, invalidate_config
 from json import dump, load
 from os import path
 from re import compile, findall, sub
+from types import MappingProxyType
 
 """
 Checks command format.
@@ -69,11 +72,10 @@ Gets a local command from config file.
 """
 
 def get_local_command(command):
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_command in config["commands"]["local"]:
-            if command.strip() == config_command["command"]:
-                return config_command
+    config = get_config()
+    for config_command in config["commands"]["local"]:
+        if command.strip() == config_command["command"]:
+            return config_command
     return False
 
 """
@@ -87,30 +89,80 @@ Gets a remote command from config file.
 """
 
 def get_remote_command(peripheral, subtype, action, room, position):
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_command in config["commands"]["remote"]:
-            if peripheral.strip().lower() == config_command["peripheral"].lower() and subtype.strip().lower() == config_command["subtype"].lower() and action.strip().lower() == config_command["action"].lower() and room.strip().lower() == config_command["room"].lower() and position.strip().lower() == config_command["position"].lower():
-                return config_command
+    config = get_config()
+    for config_command in config["commands"]["remote"]:
+        if peripheral.strip().lower() == config_command["peripheral"].lower() and subtype.strip().lower() == config_command["subtype"].lower() and action.strip().lower() == config_command["action"].lower() and room.strip().lower() == config_command["room"].lower() and position.strip().lower() == config_command["position"].lower():
+            return config_command
     return False
 
+"""
+Normalizes a phrase to be used as command index key.
+@param phrase: Phrase
+@returns: Phrase in lowercase with single spaces between words
+"""
+
+def normalize_phrase(phrase):
+    return " ".join(phrase.lower().split())
+
+"""
+Gets a command debounce window.
+@param config_command: Command
+@returns: Optional "debounce" key of command in seconds if it is a non negative number. COMMAND_DEBOUNCE if it is missing or incorrect
+"""
+
+def command_debounce(config_command):
+    debounce = config_command.get("debounce", COMMAND_DEBOUNCE)
+    if isinstance(debounce, bool) or not isinstance(debounce, (int, float)) or debounce < 0:
+        print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Debounce must be a non negative number of seconds, using {COMMAND_DEBOUNCE}{DEFAULT}")
+        return COMMAND_DEBOUNCE
+    return debounce
+
+"""
+Builds commands index by language and phrase.
+@param config: Config
+@returns: A dictionary with command execution information for each language and normalized phrase. Every command includes its debounce window and remote commands include their MQTT topic
+"""
+
+def build_command_index(config):
+    command_index = {}
+    for config_command in config["commands"]["local"] + config["commands"]["remote"]:
+        debounce = command_debounce(config_command)
+        for config_phrase in config_command["phrases"]:
+            command = {key: value for key, value in config_command.items() if key != "phrases"}
+            command["response"] = config_phrase["response"]
+            command["debounce"] = debounce
+            if "peripheral" in command:
+                command["topic"] = peripheral_topic(command["room"], command["position"], command["peripheral"], command["subtype"])
+            command = MappingProxyType(command)
+            for phrase in config_phrase["phrases"]:
+                command_index.setdefault((config_phrase["language"], normalize_phrase(phrase)), command)
+    return command_index
+
 """
 Gets a command from config file.
 @param phrase: Phrase
 @param language: Language
-@returns: Command execution information if is existing. False if not
+@returns: Command execution information if is existing. It is shared and cannot be modified. False if not
 """
 
 def get_command(phrase, language):
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_command in config["commands"]["local"] + config["commands"]["remote"]:
-            for config_phrase in config_command["phrases"]:
-                if language == config_phrase["language"] and phrase in config_phrase["phrases"]:
-                    del config_command["phrases"]
-                    config_command["response"] = config_phrase["response"]
-                    return config_command
-    return False
+    return get_config_index(build_command_index).get((language, normalize_phrase(phrase)), False)
+
+"""
+Gets responses of every command.
+@returns: A list with a tuple with response and language for each command phrase. False if there are no responses
+"""
+
+def get_responses():
+    config = get_config()
+    responses = []
+    for config_command in config["commands"]["local"] + config["commands"]["remote"]:
+        for config_phrase in config_command["phrases"]:
+            if (config_phrase["response"], config_phrase["language"]) not in responses:
+                responses.append((config_phrase["response"], config_phrase["language"]))
+    if len(responses) == 0:
+        return False
+    return responses
 
 """
 Counts the number of syllables in a phrase.
@@ -229,6 +281,7 @@ def create_local_command(command, description, age_restriction, privileged, resp
                     break
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Local command for {language} created{DEFAULT}")
     return True
 
@@ -271,6 +324,7 @@ def create_remote_command(peripheral, subtype, action, room, position, descripti
                     break
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Remote command for {language} created{DEFAULT}")
     return True
 
@@ -293,6 +347,7 @@ def remove_local_command(command):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     #remove_phrases_from_kws_file(language, phrases) for all languages
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Local command removed{DEFAULT}")
     return True
@@ -320,6 +375,7 @@ def remove_remote_command(peripheral, subtype, action, room, position):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     #remove_phrases_from_kws_file(language, phrases) for all languages
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Remote command removed{DEFAULT}")
     return True
@@ -330,11 +386,10 @@ Gets existing local commands.
 """
 
 def get_local_commands():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["commands"]["local"]) == 0:
-            return False
-        return [{"command": config_command["command"], "description": config_command["description"], "privileged": config_command["privileged"], "age_restriction": config_command["age_restriction"]} for config_command in config["commands"]["local"]]
+    config = get_config()
+    if len(config["commands"]["local"]) == 0:
+        return False
+    return [{"command": config_command["command"], "description": config_command["description"], "privileged": config_command["privileged"], "age_restriction": config_command["age_restriction"]} for config_command in config["commands"]["local"]]
 
 """
 Gets existing remote commands.
@@ -342,11 +397,10 @@ Gets existing remote commands.
 """
 
 def get_remote_commands():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["commands"]["remote"]) == 0:
-            return False
-        return [{"room": config_command["room"], "position": config_command["position"], "peripheral": config_command["peripheral"], "subtype": config_command["subtype"], "action": config_command["action"], "description": config_command["description"], "privileged": config_command["privileged"], "age_restriction": config_command["age_restriction"]} for config_command in config["commands"]["remote"]]
+    config = get_config()
+    if len(config["commands"]["remote"]) == 0:
+        return False
+    return [{"room": config_command["room"], "position": config_command["position"], "peripheral": config_command["peripheral"], "subtype": config_command["subtype"], "action": config_command["action"], "description": config_command["description"], "privileged": config_command["privileged"], "age_restriction": config_command["age_restriction"]} for config_command in config["commands"]["remote"]]
 
 """
 Edits a local command.
@@ -407,6 +461,7 @@ def edit_local_command(old_command, new_command, new_description, new_age_restri
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Local command edited{DEFAULT}")
     return True
 
@@ -481,5 +536,6 @@ def edit_remote_command(old_peripheral, old_subtype, old_action, old_room, old_p
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Remote command edited{DEFAULT}")
     return True
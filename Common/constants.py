@@ -12,14 +12,51 @@ ENCODED_FACES_PATH = FACES_PATH + "Encoded/"
 LANGUAGES_PATH = CONFIG_PATH + "Languages/"
 PICO_PATH = CONFIG_PATH + "Pico/"
 PICO_CODES_PATH = PICO_PATH + "Codes/"
+RESPONSES_PATH = CONFIG_PATH + "Responses/"
+TELEMETRY_PATH = CONFIG_PATH + "Telemetry/"
 
 FACES_EXTENSION = ".jpg"
 ENCODED_FACES_EXTENSION = ".npy"
+RESPONSES_EXTENSION = ".wav"
 
 DATE_FORMAT = "%d-%m-%Y"
 LANGUAGE_FORMAT = "^[a-z]{2}-[a-z]{2}$"
 
+AUDIO_BUFFER_CHUNKS = 64
+AUDIO_CHUNK = 1024
+AUDIO_RATE = 16000
+AUDIO_TIMEOUT = 1
+RESPONSES_CACHE_SIZE = 32
+SPEECH_SPEED = 150
+
+COMMAND_DEBOUNCE = 2
+COMMAND_RESULTS = 32
 COMMAND_TIMEOUT = 10
+COMMAND_WORKERS = 2
+FACE_TOLERANCE = 0.6
+FRAME_TIMEOUT = 1
+MOTION_AREA = 0.01
+MOTION_DETECTION_INTERVAL = 2
+MOTION_PIXEL_THRESHOLD = 25
+PERIPHERAL_STATE_MAX_AGE = 300
+SENSOR_TOPICS = ("+/+/+/get", "+/+/+/+/get")
+TRACK_ENCODING_INTERVAL = 5
+TRACK_OVERLAP = 0.3
+
+TELEMETRY_BATCH_SIZE = 256
+TELEMETRY_FLUSH_INTERVAL = 30
+TELEMETRY_MAX_SIZE = 64 * 1024 * 1024
+TELEMETRY_RETENTION = {"raw": 7 * 86400, "1m": 90 * 86400, "1h": 5 * 365 * 86400}
+TELEMETRY_RETENTION_INTERVAL = 3600
+TELEMETRY_ROLLUPS = {"1m": 60, "1h": 3600}
+TELEMETRY_SEGMENT = 86400
+
+VAD_ENERGY_RATIO = 3
+VAD_HANGOVER_CHUNKS = 8
+VAD_MIN_ENERGY = 300
+VAD_NOISE_ADAPTATION = 0.05
+VAD_PREROLL_CHUNKS = 4
+VAD_ZERO_CROSSING_RATE = 0.25
 
 BLUE = "\x1b[1;34m"
 DEFAULT = "\x1b[0m"
@@ -1,12 +1,47 @@
 from Common.constants import BLUE, CONFIG_FILE, CONFIG_PATH, DEFAULT, GREEN, PERIPHERALS_FILE, PICO_CODES_PATH, PICO_CONFIG_FILE, PICO_CONFIG_TEMPLATE_FILE, PICO_PATH, PICO_SETUP_FILE, RED
 from Common.positions import get_position, position_format
 from Common.rooms import get_room, room_format
+from Common.store import get_config, invalidate_config
 from json import dump, load
 from os import remove
 from shutil import copy
 from socket import gethostname
 from subprocess import call
 
+"""
+Converts a name into an MQTT topic level.
+@param name: Room, position, peripheral or subtype name
+@returns: Name in lowercase with underscores instead of spaces
+"""
+
+def topic_level(name):
+    return name.strip().lower().replace(" ", "_")
+
+"""
+Gets a device MQTT topic.
+@param room: Room
+@param position: Position
+@returns: Device topic
+"""
+
+def device_topic(room, position):
+    return topic_level(room) + "/" + topic_level(position)
+
+"""
+Gets a peripheral MQTT topic.
+@param room: Room
+@param position: Position
+@param peripheral: Peripheral
+@param subtype: Subtype. Empty if peripheral has no subtypes
+@returns: Peripheral topic
+"""
+
+def peripheral_topic(room, position, peripheral, subtype):
+    topic = device_topic(room, position) + "/" + topic_level(peripheral)
+    if subtype:
+        topic += "/" + topic_level(subtype)
+    return topic
+
 """
 Gets a device from config file.
 @param config_room: Room from config file
@@ -49,6 +84,7 @@ def create_device(room, position):
                 _config_room["devices"].append({"position": config_position, "installed": False, "external_peripherals": []})
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Device created{DEFAULT}")
     return True
 
@@ -117,6 +153,7 @@ def edit_device(old_room, old_position, new_room, new_position):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print (f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Device edited{DEFAULT}")
     return True
 
@@ -150,6 +187,7 @@ def remove_device(room, position):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Device removed{DEFAULT}")
     return True
 
@@ -183,7 +221,12 @@ def install_device(room, position):
         pico_config = load(pico_config_file)
         pico_config["mqtt"]["room"] = config_room["room"]
         pico_config["mqtt"]["position"] = config_position
+        pico_config["mqtt"]["topic"] = device_topic(config_room["room"], config_position)
         peripherals_config = load(peripherals_config_file)
+        for config_peripheral in peripherals_config["external"] + peripherals_config["internal"]:
+            config_peripheral["topic"] = topic_level(config_peripheral["type"])
+            for config_subtype in config_peripheral.get("subtypes", []):
+                config_subtype["topic"] = topic_level(config_subtype["subtype"])
         for peripheral in config_device["external_peripherals"]:
             for config_peripheral in peripherals_config["external"]:
                 if peripheral == config_peripheral["type"]:
@@ -213,6 +256,7 @@ def install_device(room, position):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Device installed{DEFAULT}")
     return True
 
@@ -223,11 +267,10 @@ Gets existing devices.
 
 def get_devices():
     devices = []
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_room in config["rooms"]:
-            for config_device in config_room["devices"]:
-                devices.append({"room": config_room["room"], "position": config_device["position"], "installed": config_device["installed"], "external_peripherals": config_device["external_peripherals"]})
+    config = get_config()
+    for config_room in config["rooms"]:
+        for config_device in config_room["devices"]:
+            devices.append({"room": config_room["room"], "position": config_device["position"], "installed": config_device["installed"], "external_peripherals": config_device["external_peripherals"]})
     if len(devices) == 0:
         return False
     return devices
@@ -1,4 +1,5 @@
 from Common.constants import CONFIG_FILE, CONFIG_PATH, DEFAULT, BLUE, GREEN, PICO_CONFIG_TEMPLATE_FILE, PICO_PATH, RED
+from Common.store import get_config, invalidate_config
 from json import dump, load
 
 """
@@ -7,9 +8,8 @@ Gets legal age.
 """
 
 def get_legal_age():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        return config["general"]["legal_age"]
+    config = get_config()
+    return config["general"]["legal_age"]
     
 """
 Sets legal age.
@@ -30,9 +30,42 @@ def set_legal_age(legal_age):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Legal age set{DEFAULT}")
     return True
 
+"""
+Gets face worker processes.
+@returns: Number of worker processes for face detection. 0 if faces are detected in the face recognition thread
+"""
+
+def get_face_workers():
+    config = get_config()
+    return config["general"].get("face_workers", 0)
+
+"""
+Sets face worker processes.
+@param face_workers: Number of worker processes for face detection
+@returns: True if face workers were set. False if face workers are incomplete or incorrect
+"""
+
+def set_face_workers(face_workers):
+    if not face_workers:
+        print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Face workers are incomplete{DEFAULT}")
+        return False
+    if not face_workers.isdigit():
+        print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Face workers are incorrect{DEFAULT}")
+        return False
+    with open(CONFIG_PATH + CONFIG_FILE, "r+") as config_file:
+        config = load(config_file)
+        config["general"]["face_workers"] = int(face_workers)
+        config_file.seek(0)
+        dump(config, config_file, indent=4)
+        config_file.truncate()
+    invalidate_config()
+    print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Face workers set{DEFAULT}")
+    return True
+
 """
 Gets wifi password.
 @returns: Wifi password
@@ -1,4 +1,5 @@
 from Common.constants import CONFIG_FILE, CONFIG_PATH, DEFAULT, BLUE, GREEN, RED
+from Common.store import get_config, invalidate_config
 from json import dump, load
 
 """
@@ -7,11 +8,10 @@ Gets installed languages.
 """
 
 def get_installed_languages():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["languages"]) == 0:
-            return False
-        return [language["language"] for language in config["languages"]]
+    config = get_config()
+    if len(config["languages"]) == 0:
+        return False
+    return [language["language"] for language in config["languages"]]
 
 """
 Gets default language.
@@ -19,9 +19,8 @@ Gets default language.
 """
 
 def get_default_language():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        return config["general"]["default_language"]
+    config = get_config()
+    return config["general"]["default_language"]
 
 """
 Gets language keywords path.
@@ -30,11 +29,10 @@ Gets language keywords path.
 """
 
 def get_kws_path(language):
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_language in config["languages"]:
-            if language == config_language["language"]:
-                return config_language["kws"]
+    config = get_config()
+    for config_language in config["languages"]:
+        if language == config_language["language"]:
+            return config_language["kws"]
     return False
 
 """
@@ -44,13 +42,23 @@ Gets default language files path.
 
 def get_default_language_paths():
     default_language = get_default_language()
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_language in config["languages"]:
-            if default_language == config_language["language"]:
-                return (config_language["hmm"], config_language["dic"], config_language["kws"])
+    config = get_config()
+    for config_language in config["languages"]:
+        if default_language == config_language["language"]:
+            return (config_language["hmm"], config_language["dic"], config_language["kws"])
     return False
 
+"""
+Gets installed languages files paths.
+@returns: A dictionary with Hidden Markov Model, dictionary and keywords paths for each installed language. False if there are no languages
+"""
+
+def get_languages_paths():
+    config = get_config()
+    if len(config["languages"]) == 0:
+        return False
+    return {config_language["language"]: (config_language["hmm"], config_language["dic"], config_language["kws"]) for config_language in config["languages"]}
+
 """
 Sets default language.
 @param language: Language to set as default
@@ -70,5 +78,6 @@ def set_default_language(language):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Default language set{DEFAULT}")
     return True
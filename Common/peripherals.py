@@ -1,7 +1,8 @@
-from Common.constants import BLUE, CONFIG_FILE, CONFIG_PATH, DEFAULT, GREEN, PERIPHERALS_FILE, PICO_PATH, RED
-from Common.devices import get_device
+from Common.constants import BLUE, CONFIG_FILE, CONFIG_PATH, DEFAULT, GREEN, RED
+from Common.devices import get_device, peripheral_topic
 from Common.positions import get_position, position_format
 from Common.rooms import get_room, room_format
+from Common.store import get_config_index, get_peripherals_config, invalidate_config
 from json import dump, load
 
 """
@@ -26,11 +27,10 @@ Gets an external peripheral from config file.
 """
 
 def get_external_peripheral(peripheral):
-    with open(PICO_PATH + PERIPHERALS_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_peripheral in config["external"]:
-            if peripheral.strip().lower() == config_peripheral["type"].lower():
-                return config_peripheral
+    config = get_peripherals_config()
+    for config_peripheral in config["external"]:
+        if peripheral.strip().lower() == config_peripheral["type"].lower():
+            return config_peripheral
     return False
 
 """
@@ -73,6 +73,7 @@ def assign_external_peripheral(peripheral, room, position):
                         _config_device["installed"] = False
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Peripheral assigned to device{DEFAULT}")
     return True
 
@@ -117,6 +118,7 @@ def deassign_external_peripheral(peripheral, room, position):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Peripheral deassigned from device{DEFAULT}")
     return True
 
@@ -126,11 +128,10 @@ Gets existing internal peripherals.
 """
 
 def get_internal_peripherals():
-    with open(PICO_PATH + PERIPHERALS_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["internal"]) == 0:
-            return False
-        return [{"type": config_peripheral["type"], "actions": config_peripheral["actions"]} for config_peripheral in config["internal"]]
+    config = get_peripherals_config()
+    if len(config["internal"]) == 0:
+        return False
+    return [{"type": config_peripheral["type"], "actions": config_peripheral["actions"]} for config_peripheral in config["internal"]]
 
 """
 Gets existing external peripherals.
@@ -138,11 +139,10 @@ Gets existing external peripherals.
 """
 
 def get_external_peripherals():
-    with open(PICO_PATH + PERIPHERALS_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["external"]) == 0:
-            return False
-        return [{"type": config_peripheral["type"], "actions": config_peripheral["actions"]} for config_peripheral in config["external"]]
+    config = get_peripherals_config()
+    if len(config["external"]) == 0:
+        return False
+    return [{"type": config_peripheral["type"], "actions": config_peripheral["actions"]} for config_peripheral in config["external"]]
 
 """
 Gets device peripherals.
@@ -170,11 +170,10 @@ Gets peripheral subtypes.
 """
 
 def get_peripheral_subtypes(peripheral):
-    with open(PICO_PATH + PERIPHERALS_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_peripheral in config["external"] + config["internal"]:
-            if peripheral.strip().lower() == config_peripheral["type"].lower() and "subtypes" in config_peripheral:
-                return [config_subtype["subtype"] for config_subtype in config_peripheral["subtypes"]]
+    config = get_peripherals_config()
+    for config_peripheral in config["external"] + config["internal"]:
+        if peripheral.strip().lower() == config_peripheral["type"].lower() and "subtypes" in config_peripheral:
+            return [config_subtype["subtype"] for config_subtype in config_peripheral["subtypes"]]
     return False
 
 """
@@ -184,9 +183,42 @@ Gets peripheral actions.
 """
 
 def get_peripheral_actions(peripheral):
-    with open(PICO_PATH + PERIPHERALS_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_peripheral in config["external"] + config["internal"]:
-            if peripheral.strip().lower() == config_peripheral["type"].lower() and "actions" in config_peripheral:
-                return config_peripheral["actions"]
+    config = get_peripherals_config()
+    for config_peripheral in config["external"] + config["internal"]:
+        if peripheral.strip().lower() == config_peripheral["type"].lower() and "actions" in config_peripheral:
+            return config_peripheral["actions"]
     return False
+
+"""
+Builds sensors topic trie of installed devices.
+@param config: Config
+@returns: A trie with a level for each topic level. Get topic of each peripheral and subtype with get action of every installed device ends in a None key with its room, position, peripheral and subtype
+"""
+
+def build_sensor_trie(config):
+    sensor_trie = {}
+    for config_room in config["rooms"]:
+        for config_device in config_room["devices"]:
+            if config_device["installed"]:
+                for peripheral in config_device["external_peripherals"] + [peripheral["type"] for peripheral in get_internal_peripherals() or []]:
+                    if "get" in (get_peripheral_actions(peripheral) or []):
+                        for subtype in get_peripheral_subtypes(peripheral) or [""]:
+                            node = sensor_trie
+                            for level in (peripheral_topic(config_room["room"], config_device["position"], peripheral, subtype) + "/get").split("/"):
+                                node = node.setdefault(level, {})
+                            node[None] = {"room": config_room["room"], "position": config_device["position"], "peripheral": peripheral, "subtype": subtype}
+    return sensor_trie
+
+"""
+Gets the sensor a topic belongs to.
+@param topic: MQTT topic
+@returns: A dictionary with room, position, peripheral and subtype. False if topic is not a sensor topic of an installed device
+"""
+
+def get_sensor(topic):
+    node = get_config_index(build_sensor_trie)
+    for level in topic.split("/"):
+        node = node.get(level)
+        if node is None:
+            return False
+    return node.get(None, False)
\ No newline at end of file
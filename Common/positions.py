@@ -1,4 +1,5 @@
 from Common.constants import BLUE, CONFIG_FILE, CONFIG_PATH, DEFAULT, GREEN, RED
+from Common.store import get_config, invalidate_config
 from json import dump, load
 
 """
@@ -23,11 +24,10 @@ Gets a position from config file.
 """
 
 def get_position(position):
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_position in config["positions"]:
-            if position.strip().lower() == config_position.lower():
-                return config_position
+    config = get_config()
+    for config_position in config["positions"]:
+        if position.strip().lower() == config_position.lower():
+            return config_position
     return False
 
 """
@@ -48,6 +48,7 @@ def create_position(position):
         config["positions"].append(position.strip().capitalize())
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Position created{DEFAULT}")
     return True
 
@@ -89,6 +90,7 @@ def edit_position(old_position, new_position):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Position edited{DEFAULT}")
     return True
 
@@ -112,6 +114,7 @@ def remove_position(position):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Position removed{DEFAULT}")
     return True
 
@@ -130,6 +133,7 @@ def remove_devices(position):
                     config_file.seek(0)
                     dump(config, config_file, indent=4)
                     config_file.truncate()
+    invalidate_config()
 
 """
 Gets existing positions.
@@ -137,8 +141,7 @@ Gets existing positions.
 """
 
 def get_positions():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["positions"]) == 0:
-            return False
-        return config["positions"]
+    config = get_config()
+    if len(config["positions"]) == 0:
+        return False
+    return config["positions"]
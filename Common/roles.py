@@ -1,4 +1,5 @@
 from Common.constants import BLUE, CONFIG_FILE, CONFIG_PATH, DEFAULT, GREEN, RED
+from Common.store import get_config, invalidate_config
 from Common.users import age, get_user, name_format
 from json import dump, load
 
@@ -24,11 +25,10 @@ Gets a role from config file.
 """
 
 def get_role(role):
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_role in config["roles"]:
-            if role.strip().lower() == config_role["role"].lower():
-                return config_role
+    config = get_config()
+    for config_role in config["roles"]:
+        if role.strip().lower() == config_role["role"].lower():
+            return config_role
     return False
 
 """
@@ -51,6 +51,7 @@ def create_role(role, age_restriction, privileged):
         config["roles"].append({"role": role.strip().capitalize(), "age_restriction": age_restriction, "privileged": privileged, "users": []})
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Role created{DEFAULT}")
     return True
 
@@ -88,6 +89,7 @@ def edit_role(old_role, new_role, new_age_restriction, new_privileged):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Role edited{DEFAULT}")
     return True
 
@@ -110,6 +112,7 @@ def remove_role(role):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Role removed{DEFAULT}")
     return True
 
@@ -144,6 +147,7 @@ def assign_role(role, name):
                 _config_role["users"].append(config_user["name"])
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Role assigned to user{DEFAULT}")
     return True
 
@@ -176,6 +180,7 @@ def deassign_role(role, name):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Role deassigned from user{DEFAULT}")
     return True
 
@@ -185,8 +190,7 @@ Gets existing roles.
 """
 
 def get_roles():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["roles"]) == 0:
-            return False
-        return [{"role": config_role["role"], "age_restriction": config_role["age_restriction"], "privileged": config_role["privileged"], "users": config_role["users"]} for config_role in config["roles"]]
+    config = get_config()
+    if len(config["roles"]) == 0:
+        return False
+    return [{"role": config_role["role"], "age_restriction": config_role["age_restriction"], "privileged": config_role["privileged"], "users": config_role["users"]} for config_role in config["roles"]]
@@ -1,4 +1,5 @@
 from Common.constants import BLUE, CONFIG_FILE, CONFIG_PATH, DEFAULT, GREEN, RED
+from Common.store import get_config, invalidate_config
 from json import dump, load
 
 """
@@ -23,11 +24,10 @@ Gets a room from config file.
 """
 
 def get_room(room):
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_room in config["rooms"]:
-            if room.strip().lower() == config_room["room"].lower():
-                return config_room
+    config = get_config()
+    for config_room in config["rooms"]:
+        if room.strip().lower() == config_room["room"].lower():
+            return config_room
     return False
 
 """
@@ -48,6 +48,7 @@ def create_room(room):
         config["rooms"].append({"room": room.strip().capitalize(), "devices": []})
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Room created{DEFAULT}")
     return True
 
@@ -86,6 +87,7 @@ def edit_room(old_room, new_room):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Room edited{DEFAULT}")
     return True
 
@@ -108,6 +110,7 @@ def remove_room(room):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Room removed{DEFAULT}")
     return True
 
@@ -117,8 +120,7 @@ Gets existing rooms.
 """
 
 def get_rooms():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["rooms"]) == 0:
-            return False
-        return [config_room["room"] for config_room in config["rooms"]]
+    config = get_config()
+    if len(config["rooms"]) == 0:
+        return False
+    return [config_room["room"] for config_room in config["rooms"]]
@@ -0,0 +1,116 @@
+from Common.constants import CONFIG_FILE, CONFIG_PATH, PERIPHERALS_FILE, PICO_PATH
+from json import load
+from os import stat
+from threading import Lock
+
+"""
+Config file loaded once and kept in memory until it changes on disk.
+"""
+
+class ConfigStore:
+
+    """
+    Constructs config store.
+    @param file_path: Config file path
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.config = None
+        self.signature = None
+        self.version = 0
+        self.indexes = {}
+        self.lock = Lock()
+
+    """
+    Gets config file signature.
+    @returns: A tuple with inode, size and modification time of config file. None if config file cannot be accessed
+    """
+
+    def stat(self):
+        try:
+            file_stat = stat(self.file_path)
+        except OSError:
+            return None
+        return (file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+
+    """
+    Gets config. It is only read from disk when its signature has changed since last read, so the returned config must not be modified.
+    @returns: Config
+    """
+
+    def get(self):
+        with self.lock:
+            return self.refresh()
+
+    """
+    Reads config from disk if its signature has changed since last read. Lock must be held.
+    @returns: Config
+    """
+
+    def refresh(self):
+        signature = self.stat()
+        if self.config is None or signature is None or signature != self.signature:
+            with open(self.file_path, "r") as config_file:
+                self.config = load(config_file)
+            self.signature = signature
+            self.version += 1
+            self.indexes = {}
+        return self.config
+
+    """
+    Gets an index derived from config. It is built once per config version, so the returned index must not be modified.
+    @param builder: Function that builds the index from config
+    @returns: Index
+    """
+
+    def get_index(self, builder):
+        with self.lock:
+            config = self.refresh()
+            if builder not in self.indexes:
+                self.indexes[builder] = builder(config)
+            return self.indexes[builder]
+
+    """
+    Forces config to be read from disk on next access.
+    """
+
+    def invalidate(self):
+        with self.lock:
+            self.signature = None
+
+config_store = ConfigStore(CONFIG_PATH + CONFIG_FILE)
+peripherals_store = ConfigStore(PICO_PATH + PERIPHERALS_FILE)
+
+"""
+Gets config from memory.
+@returns: Config
+"""
+
+def get_config():
+    return config_store.get()
+
+"""
+Gets an index derived from config.
+@param builder: Function that builds the index from config
+@returns: Index
+"""
+
+def get_config_index(builder):
+    return config_store.get_index(builder)
+
+"""
+Forces config to be read from disk on next access. Must be called after writing config file, as a rewrite keeping its size within the same modification time tick would not change its signature.
+"""
+
+def invalidate_config():
+    config_store.invalidate()
+
+"""
+Gets peripherals config from memory.
+@returns: Peripherals config
+"""
+
+def get_peripherals_config():
+    return peripherals_store.get()
+
@@ -0,0 +1,309 @@
+from Common.constants import BLUE, DEFAULT, RED, TELEMETRY_BATCH_SIZE, TELEMETRY_FLUSH_INTERVAL, TELEMETRY_MAX_SIZE, TELEMETRY_RETENTION, TELEMETRY_RETENTION_INTERVAL, TELEMETRY_ROLLUPS, TELEMETRY_SEGMENT
+from Common.devices import peripheral_topic, topic_level
+from numpy import add, argsort, array, concatenate, empty, float32, float64, fromfile, full, inf, maximum, minimum, uint32, unique, zeros
+from os import listdir, makedirs, path, remove, walk
+from threading import Event, Lock, Thread
+from time import time
+
+RAW_COLUMNS = {"time": float64, "value": float32}
+ROLLUP_COLUMNS = {"time": float64, "count": uint32, "sum": float64, "min": float32, "max": float32}
+
+"""
+Converts a sensor payload into a telemetry value.
+@param payload: Sensor payload, as a number or as a tuple of numbers
+@returns: Payload as a number, or mean of its numbers if it is a tuple. None if payload is not numeric
+"""
+
+def telemetry_value(payload):
+    try:
+        return float(payload)
+    except ValueError:
+        pass
+    values = payload.strip("()[] ").split(",")
+    try:
+        return sum(float(value) for value in values) / len(values)
+    except ValueError:
+        return None
+
+"""
+Checks whether a series topic matches a query. None levels match any level.
+@param topic: Series topic
+@param levels: A list with room, position, peripheral and subtype levels. Empty subtype only matches peripherals without subtypes
+@returns: True if topic matches. False if not
+"""
+
+def topic_matches(topic, levels):
+    topic_levels = topic.split("/")
+    if levels[3] is not None and len(topic_levels) != (4 if levels[3] else 3):
+        return False
+    return all(level is None or level == topic_level for level, topic_level in zip(levels, topic_levels))
+
+"""
+Telemetry time-series store structure. Sensor values are kept in memory and written in batches to append-only columnar segments, one file per column and day, together with 1m and 1h rollups. Old segments are removed once they exceed their retention or the store exceeds TELEMETRY_MAX_SIZE.
+"""
+
+class TelemetryStore:
+
+    """
+    Constructs telemetry store structure.
+    @param telemetry_path: Telemetry directory path
+    """
+
+    def __init__(self, telemetry_path):
+        self.telemetry_path = telemetry_path
+        self.samples = {}
+        self.open_buckets = {}
+        self.closed_buckets = {}
+        self.pending = 0
+        self.last_retention = 0
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.wake = Event()
+        self.stopped = Event()
+        self.t_telemetry = None
+
+    """
+    Starts writing batches in background.
+    """
+
+    def start(self):
+        self.t_telemetry = Thread(target=self.run)
+        self.t_telemetry.daemon = True
+        self.t_telemetry.start()
+
+    """
+    Stops writing batches, writing every value still in memory.
+    """
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        if self.t_telemetry is not None:
+            self.t_telemetry.join()
+
+    """
+    Writes batches every TELEMETRY_FLUSH_INTERVAL seconds, or as soon as TELEMETRY_BATCH_SIZE values are pending, until stopped.
+    """
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.wait(TELEMETRY_FLUSH_INTERVAL)
+            self.wake.clear()
+            try:
+                self.flush(self.stopped.is_set())
+            except (OSError, ValueError):
+                print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Cannot flush telemetry{DEFAULT}")
+
+    """
+    Keeps a sensor value in memory until next batch is written.
+    @param sensor: A dictionary with room, position, peripheral and subtype
+    @param payload: Sensor payload
+    @param sample_time: Sample time in seconds since epoch. Current time if not given
+    @returns: True if value was kept. False if payload is not numeric
+    """
+
+    def append(self, sensor, payload, sample_time=None):
+        value = telemetry_value(payload)
+        if value is None:
+            return False
+        sample_time = time() if sample_time is None else sample_time
+        topic = peripheral_topic(sensor["room"], sensor["position"], sensor["peripheral"], sensor["subtype"])
+        with self.lock:
+            self.samples.setdefault(topic, []).append((sample_time, value))
+            for resolution, interval in TELEMETRY_ROLLUPS.items():
+                key = (resolution, topic)
+                bucket_time = sample_time // interval * interval
+                bucket = self.open_buckets.get(key)
+                if bucket is not None and bucket[0] == bucket_time:
+                    bucket[1] += 1
+                    bucket[2] += value
+                    bucket[3] = min(bucket[3], value)
+                    bucket[4] = max(bucket[4], value)
+                    continue
+                if bucket is not None:
+                    self.closed_buckets.setdefault(key, []).append(tuple(bucket))
+                self.open_buckets[key] = [bucket_time, 1, value, value, value]
+            self.pending += 1
+            if self.pending >= TELEMETRY_BATCH_SIZE:
+                self.wake.set()
+        return True
+
+    """
+    Writes values in memory and closed rollups to disk, and applies retention every TELEMETRY_RETENTION_INTERVAL seconds.
+    @param close_all: Whether rollups still open must also be written
+    """
+
+    def flush(self, close_all=False):
+        with self.flush_lock:
+            current_time = time()
+            with self.lock:
+                for key, bucket in list(self.open_buckets.items()):
+                    if close_all or bucket[0] + TELEMETRY_ROLLUPS[key[0]] <= current_time:
+                        self.closed_buckets.setdefault(key, []).append(tuple(bucket))
+                        del self.open_buckets[key]
+                samples, self.samples = self.samples, {}
+                closed_buckets, self.closed_buckets = self.closed_buckets, {}
+                self.pending = 0
+            for topic, rows in samples.items():
+                self.write("raw", topic, RAW_COLUMNS, rows)
+            for (resolution, topic), rows in closed_buckets.items():
+                self.write(resolution, topic, ROLLUP_COLUMNS, rows)
+            if close_all or current_time - self.last_retention >= TELEMETRY_RETENTION_INTERVAL:
+                self.retain(current_time)
+                self.last_retention = current_time
+
+    """
+    Appends rows to the segments of a series, one file per column.
+    @param resolution: Resolution
+    @param topic: Series topic
+    @param columns: A dictionary with data type of each column
+    @param rows: A list with a tuple with a value for each column
+    @returns: True if rows were written. False if not
+    """
+
+    def write(self, resolution, topic, columns, rows):
+        series_path = self.telemetry_path + resolution + "/" + topic + "/"
+        table = array(rows, dtype=float64)
+        segments = (table[:, 0] // TELEMETRY_SEGMENT * TELEMETRY_SEGMENT).astype(int)
+        try:
+            makedirs(series_path, exist_ok=True)
+            for segment in unique(segments):
+                segment_table = table[segments == segment]
+                for index, (column, dtype) in enumerate(columns.items()):
+                    with open(f"{series_path}{segment}.{column}", "ab") as column_file:
+                        segment_table[:, index].astype(dtype).tofile(column_file)
+        except OSError:
+            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Cannot write telemetry of {topic}{DEFAULT}")
+            return False
+        return True
+
+    """
+    Reads the segments of a series within a time range.
+    @param resolution: Resolution
+    @param topic: Series topic
+    @param columns: A dictionary with data type of each column
+    @param start: Range start in seconds since epoch. None if unbounded
+    @param end: Range end in seconds since epoch, excluded. None if unbounded
+    @returns: A dictionary with an array for each column
+    """
+
+    def read(self, resolution, topic, columns, start, end):
+        series_path = self.telemetry_path + resolution + "/" + topic + "/"
+        tables = {column: [] for column in columns}
+        try:
+            segments = sorted(int(file_name.split(".")[0]) for file_name in listdir(series_path) if file_name.endswith(".time") and file_name.split(".")[0].lstrip("-").isdigit())
+        except OSError:
+            segments = []
+        for segment in segments:
+            if (start is not None and segment + TELEMETRY_SEGMENT <= start) or (end is not None and segment >= end):
+                continue
+            try:
+                segment_table = {column: fromfile(f"{series_path}{segment}.{column}", dtype=dtype) for column, dtype in columns.items()}
+            except OSError:
+                continue
+            rows = min(len(values) for values in segment_table.values())
+            for column, values in segment_table.items():
+                tables[column].append(values[:rows])
+        return {column: concatenate(values) if values else empty(0, dtype=columns[column]) for column, values in tables.items()}
+
+    """
+    Gets the series topics stored on disk for a resolution.
+    @param resolution: Resolution
+    @returns: A set with series topics
+    """
+
+    def topics(self, resolution):
+        resolution_path = self.telemetry_path + resolution
+        return {path.relpath(series_path, resolution_path) for series_path, _, file_names in walk(resolution_path) if file_names}
+
+    """
+    Queries telemetry, including values not yet written to disk.
+    @param room: Room. None for any room
+    @param position: Position. None for any position
+    @param peripheral: Peripheral. None for any peripheral
+    @param subtype: Subtype. None for any subtype, empty for peripherals without subtypes
+    @param start: Range start in seconds since epoch. None if unbounded
+    @param end: Range end in seconds since epoch, excluded. None if unbounded
+    @param resolution: "raw" or a rollup from TELEMETRY_ROLLUPS
+    @returns: A dictionary with time and value arrays for raw resolution, or time, count, mean, min and max arrays for rollups, for each series topic. False if resolution does not exist
+    """
+
+    def query(self, room=None, position=None, peripheral=None, subtype=None, start=None, end=None, resolution="raw"):
+        if resolution != "raw" and resolution not in TELEMETRY_ROLLUPS:
+            return False
+        columns = RAW_COLUMNS if resolution == "raw" else ROLLUP_COLUMNS
+        levels = [None if name is None else topic_level(name) for name in (room, position, peripheral, subtype)]
+        series = {}
+        with self.flush_lock:
+            with self.lock:
+                if resolution == "raw":
+                    memory_rows = {topic: list(rows) for topic, rows in self.samples.items()}
+                else:
+                    memory_rows = {topic: list(rows) for (bucket_resolution, topic), rows in self.closed_buckets.items() if bucket_resolution == resolution}
+                    for (bucket_resolution, topic), bucket in self.open_buckets.items():
+                        if bucket_resolution == resolution:
+                            memory_rows.setdefault(topic, []).append(tuple(bucket))
+            for topic in self.topics(resolution) | set(memory_rows):
+                if topic_matches(topic, levels):
+                    series[topic] = self.read(resolution, topic, columns, start, end)
+        for topic, table in series.items():
+            if topic in memory_rows:
+                memory_table = array(memory_rows[topic], dtype=float64)
+                for index, (column, dtype) in enumerate(columns.items()):
+                    table[column] = concatenate((table[column], memory_table[:, index].astype(dtype)))
+            in_range = (table["time"] >= (-inf if start is None else start)) & (table["time"] < (inf if end is None else end))
+            order = argsort(table["time"][in_range], kind="stable")
+            table = {column: values[in_range][order] for column, values in table.items()}
+            series[topic] = table if resolution == "raw" else merge_rollups(table)
+        return series
+
+    """
+    Removes segments older than their retention, and then oldest segments, raw ones first, while the store exceeds TELEMETRY_MAX_SIZE. Files that are not segments are left untouched.
+    @param current_time: Current time in seconds since epoch
+    @returns: True if retention was applied. False if some segment could not be removed
+    """
+
+    def retain(self, current_time):
+        segments, size = {}, {}
+        try:
+            for priority, resolution in enumerate(["raw"] + list(TELEMETRY_ROLLUPS)):
+                for series_path, _, file_names in walk(self.telemetry_path + resolution):
+                    for file_name in file_names:
+                        segment = file_name.split(".")[0]
+                        if not segment.lstrip("-").isdigit():
+                            continue
+                        segment = int(segment)
+                        file_path = path.join(series_path, file_name)
+                        if segment + TELEMETRY_SEGMENT <= current_time - TELEMETRY_RETENTION[resolution]:
+                            remove(file_path)
+                            continue
+                        key = (priority, segment, series_path)
+                        segments.setdefault(key, []).append(file_path)
+                        size[key] = size.get(key, 0) + path.getsize(file_path)
+            total_size = sum(size.values())
+            for key in sorted(segments):
+                if total_size <= TELEMETRY_MAX_SIZE:
+                    break
+                for file_path in segments[key]:
+                    remove(file_path)
+                total_size -= size[key]
+        except OSError:
+            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Cannot apply telemetry retention{DEFAULT}")
+            return False
+        return True
+
+"""
+Merges rollup rows sharing the same time, as written by different batches.
+@param table: A dictionary with time, count, sum, min and max arrays sorted by time
+@returns: A dictionary with time, count, mean, min and max arrays
+"""
+
+def merge_rollups(table):
+    times, indexes = unique(table["time"], return_inverse=True)
+    count, total = zeros(len(times), dtype=uint32), zeros(len(times), dtype=float64)
+    lowest, highest = full(len(times), inf, dtype=float32), full(len(times), -inf, dtype=float32)
+    add.at(count, indexes, table["count"])
+    add.at(total, indexes, table["sum"])
+    minimum.at(lowest, indexes, table["min"])
+    maximum.at(highest, indexes, table["max"])
+    return {"time": times, "count": count, "mean": total / count, "min": lowest, "max": highest}
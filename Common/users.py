@@ -1,5 +1,6 @@
 from calendar import timegm
 from Common.constants import BLUE, CONFIG_FILE, CONFIG_PATH, DATE_FORMAT, DEFAULT, ENCODED_FACES_EXTENSION, ENCODED_FACES_PATH, FACES_EXTENSION, FACES_PATH, GREEN, RED
+from Common.store import get_config, get_config_index, invalidate_config
 from cv2 import CAP_V4L2, imwrite, VideoCapture
 from datetime import datetime
 from face_recognition import face_encodings, load_image_file
@@ -76,11 +77,10 @@ Gets a user from config file.
 """
 
 def get_user(name):
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_user in config["users"]:
-            if name.strip().lower() == config_user["name"].lower():
-                return config_user
+    config = get_config()
+    for config_user in config["users"]:
+        if name.strip().lower() == config_user["name"].lower():
+            return config_user
     return False
 
 """
@@ -115,6 +115,7 @@ def create_user(name, birth_date):
         config["users"].append({"name": name.strip().capitalize(), "birth_date": birth_date.strip(), "face": timestamp.strip()})
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}User created{DEFAULT}")
     return True
 
@@ -153,6 +154,7 @@ def edit_user(old_name, new_name, new_birth_date):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}User edited{DEFAULT}")
     return True
 
@@ -190,6 +192,7 @@ def edit_user_face(name):
                 break
         config_file.seek(0)
         dump(config, config_file, indent=4)
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}User face edited{DEFAULT}")
     return True
 
@@ -218,6 +221,7 @@ def remove_user(name):
         config_file.seek(0)
         dump(config, config_file, indent=4)
         config_file.truncate()
+    invalidate_config()
     print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}User removed{DEFAULT}")
     return True
 
@@ -235,6 +239,7 @@ def deassign_roles(name):
                 config_file.seek(0)
                 dump(config, config_file, indent=4)
                 config_file.truncate()
+    invalidate_config()
 
 """
 Returns user's age.
@@ -253,14 +258,32 @@ Gets existing users.
 """
 
 def get_users():
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        if len(config["users"]) == 0:
-            return False
-        return [{"name": config_user["name"], "age": age(config_user["birth_date"]), "face": config_user["face"]} for config_user in config["users"]]
+    config = get_config()
+    if len(config["users"]) == 0:
+        return False
+    return [{"name": config_user["name"], "age": age(config_user["birth_date"]), "face": config_user["face"]} for config_user in config["users"]]
+
+"""
+Builds users permissions table.
+@param config: Config
+@returns: A dictionary with roles age restriction, roles privileged and date of legal age for each user name in lowercase
+"""
+
+def build_permissions_table(config):
+    permissions_table = {}
+    for config_user in config["users"]:
+        birth_date = datetime.strptime(config_user["birth_date"], DATE_FORMAT)
+        permissions_table[config_user["name"].lower()] = {"age_restriction": False, "privileged": False, "legal_age_date": (birth_date.year + config["general"]["legal_age"], birth_date.month, birth_date.day)}
+    for config_role in config["roles"]:
+        for user in config_role["users"]:
+            user_permissions = permissions_table.get(user.lower())
+            if user_permissions:
+                user_permissions["age_restriction"] = user_permissions["age_restriction"] or bool(config_role["age_restriction"])
+                user_permissions["privileged"] = user_permissions["privileged"] or bool(config_role["privileged"])
+    return permissions_table
 
 """
-Gets user permissions depending on his roles.
+Gets user permissions depending on their roles and age. Age restriction only applies while user is under legal age.
 @param name: Name
 @returns: A dictionary with age restricion and privileged. False if name is incomplete or incorrect or user is not existing
 """
@@ -268,21 +291,9 @@ Gets user permissions depending on his roles.
 def get_user_permissions(name):
     if not name_format(name):
         return False
-    config_user = get_user(name)
-    if not config_user:
+    user_permissions = get_config_index(build_permissions_table).get(name.strip().lower())
+    if not user_permissions:
         print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Non existing user{DEFAULT}")
         return False
-    age_restriction = False
-    privileged = False
-    with open(CONFIG_PATH + CONFIG_FILE, "r") as config_file:
-        config = load(config_file)
-        for config_role in config["roles"]:
-            for user in config_role["users"]:
-                if user == name:
-                    if config_role["age_restriction"]:
-                        age_restriction = True
-                    if config_role["privileged"]:
-                        privileged = True
-                    if age_restriction and privileged:
-                        break
-    return {"age_restriction": age_restriction, "privileged": privileged}
\ No newline at end of file
+    current_date = datetime.now()
+    return {"age_restriction": user_permissions["age_restriction"] and (current_date.year, current_date.month, current_date.day) < user_permissions["legal_age_date"], "privileged": user_permissions["privileged"]}
\ No newline at end of file
@@ -1,20 +1,24 @@
+MQTT_KEEPALIVE = 60
+SENSORS_INTERVAL = 60
+WIFI_WAIT = 100
+
 """
 Manages an action about integrated led.
+@param peripheral: Integrated led peripheral
 @param action: Action
 """
 
-def integrated_led(action):
-    from machine import Pin
-    led = Pin("LED", Pin.OUT)
-    if action == "get":
+def integrated_led(peripheral, action):
+    led, status_topic, _ = peripheral
+    if action == b"get":
         print("Publishing integrated led status...")
-        client.publish(f"{client.client_id}/integrated_led/get", str(get_integrated_led()), qos=1)
-    elif action == "off":
+    elif action == b"off":
         print("Turning off integrated led...")
         off_integrated_led(led)
-    elif action == "on":
+    elif action == b"on":
         print("Turning on integrated led...")
         on_integrated_led(led)
+    publish_status(status_topic, str(get_integrated_led(led)))
 
 """
 Obtains integrated led status.
@@ -43,86 +47,75 @@ def on_integrated_led(led):
 
 """
 Manage an action about internal temperature.
+@param peripheral: Internal temperature peripheral
 @param action: Action
 """
 
-def internal_temperature(action):
-    if action == "get":
+def internal_temperature(peripheral, action):
+    sensor, status_topic, _ = peripheral
+    if action == b"get":
         print("Publishing internal temperature...")
-        client.publish(f"{client.client_id}/internal_temperature/get", str(get_internal_temperature()), qos=1)
+        publish_status(status_topic, str(get_internal_temperature(sensor)))
 
 """
 Obtains internal device temperature.
+@param sensor: Temperature sensor ADC
 @returns: Internal temperature
 """
 
-def get_internal_temperature():
-    from machine import ADC
-    voltage = ADC(4).read_u16() * 3.3 / 65535.0
+def get_internal_temperature(sensor):
+    voltage = sensor.read_u16() * 3.3 / 65535.0
     return 27.0 - (voltage - 0.706) / 0.001721
 
 """
 Manages an action about BerryClip buzzer.
+@param peripheral: BerryClip buzzer peripheral
 @param action: Action
 """
 
-def berryclip_buzzer(action):
-    from machine import Pin, PWM
-    from ujson import load
-    buzzer = None
-    with open("config.json") as config_file:
-        config = load(config_file)
-        for config_peripheral in config["peripherals"]["external"]:
-            if config_peripheral["type"] == "BerryClip Buzzer":
-                buzzer = PWM(Pin(config_peripheral["pins"][0], Pin.OUT))
-    if action == "sound":
+def berryclip_buzzer(peripheral, action):
+    from uasyncio import create_task
+    (buzzer, lock), _, _ = peripheral
+    if action == b"sound":
         print("Sounding BerryClip buzzer...")
-        sound_berryclip_buzzer(buzzer)
+        create_task(sound_berryclip_buzzer(buzzer, lock))
 
 """
-Sounds BerryClip buzzer.
+Sounds BerryClip buzzer in background. Buzzes requested while sounding are played after it.
 @param buzzer: Buzzer
+@param lock: Buzzer lock
 @param frequency: Buzzer frecuency
 @param buzz_duration: Buzz duration in seconds
 @param silence_duration: Silence duration after buzz in seconds
 """
 
-def sound_berryclip_buzzer(buzzer, frequency = 987, buzz_duration = 0.75, silence_duration = 0.25):
-    from time import sleep
-    buzzer.duty_u16(int(65536 * 0.2))
-    buzzer.freq(frequency)
-    sleep(buzz_duration)
-    buzzer.duty_u16(int(65536 * 0))
-    sleep(silence_duration)
+async def sound_berryclip_buzzer(buzzer, lock, frequency = 987, buzz_duration = 0.75, silence_duration = 0.25):
+    from uasyncio import sleep
+    async with lock:
+        buzzer.duty_u16(int(65536 * 0.2))
+        buzzer.freq(frequency)
+        await sleep(buzz_duration)
+        buzzer.duty_u16(int(65536 * 0))
+        await sleep(silence_duration)
 
 """
 Manages an action about BerryClip led.
-@param subtype: Led color
+@param peripheral: BerryClip led color peripheral
 @param action: Action
 """
 
-def berryclip_led(subtype, action):
-    from machine import Pin
-    from ujson import load
-    led_0, led_1 = None, None
-    with open("config.json") as config_file:
-        config = load(config_file)
-        for config_peripheral in config["peripherals"]["external"]:
-            if config_peripheral["type"] == "BerryClip Led":
-                for config_subtype in config_peripheral["subtypes"]:
-                    if config_subtype["subtype"].lower().replace(" ", "_") == subtype:
-                        led_0 = Pin(config_subtype["pins"][0], Pin.OUT)
-                        led_1 = Pin(config_subtype["pins"][1], Pin.OUT)
-    if action == "get":
+def berryclip_led(peripheral, action):
+    (led_0, led_1), status_topic, subtype = peripheral
+    if action == b"get":
         print(f"Publishing BerryClip {subtype} led status...")
-        client.publish(f"{client.client_id}/berryclip_led/{subtype}/get", str(get_berryclip_led(led_0, led_1)), qos=1)
-    elif action == "off":
+    elif action == b"off":
         print(f"Turning off BerryClip {subtype} led...")
         off_berryclip_led(led_0, led_1)
-    elif action == "on":
+    elif action == b"on":
         print(f"Turning on BerryClip {subtype} led...")
         on_berryclip_led(led_0, led_1)
-    
+    publish_status(status_topic, str(get_berryclip_led(led_0, led_1)))
+
 """
 Obtains BerryClip led color status.
 @param led_0: Led 0
@@ -153,6 +146,18 @@ def on_berryclip_led(led_0, led_1):
     led_0.on()
     led_1.on()
 
+"""
+Publishes a peripheral status as a retained message, so it is known by the host as soon as it subscribes. Status is not published while disconnected from the broker. QoS 0 is used so that publishing never waits for the broker.
+@param topic: Status topic
+@param status: Status
+"""
+
+def publish_status(topic, status):
+    try:
+        client.publish(topic, status, retain=True)
+    except OSError:
+        pass
+
 """
 Callback to process subscripted data.
 @param topic: MQTT topic
@@ -160,110 +165,162 @@ Callback to process subscripted data.
 """
 
 def callback(topic, message):
-    split_topic = topic.decode().split("/")
-    if split_topic[2] == "berryclip_led":
-        berryclip_led(split_topic[3], message.decode())
-    elif split_topic[2] == "berryclip_buzzer":
-        berryclip_buzzer(message.decode())
-    elif split_topic[2] == "integrated_led":
-        integrated_led(message.decode())
-    elif split_topic[2] == "internal_temperature":
-        internal_temperature(message.decode())
+    topic_handler = topic_handlers.get(topic)
+    if topic_handler is not None:
+        topic_handler[0](topic_handler[1], message)
+
+"""
+Builds peripherals table from config, constructing pin objects once.
+@param config: Config
+@returns: A dictionary with a tuple with handler, peripheral and whether it is a sensor to be sampled periodically for each peripheral and subtype, indexed by their topic suffix. Peripheral is a tuple with pin objects, status topic, None if peripheral has no get action, and subtype, empty if peripheral has no subtypes
+"""
+
+def load_peripherals(config):
+    from machine import ADC, Pin, PWM
+    from uasyncio import Lock
+    peripherals = {}
+    for config_peripheral in config["peripherals"]["internal"] + config["peripherals"]["external"]:
+        for config_subtype in config_peripheral.get("subtypes", [None]):
+            suffix = config_peripheral["topic"] + ("/" + config_subtype["topic"] if config_subtype else "")
+            if config_peripheral["type"] == "Integrated Led":
+                handler, pins = integrated_led, Pin("LED", Pin.OUT)
+            elif config_peripheral["type"] == "Internal Temperature":
+                handler, pins = internal_temperature, ADC(4)
+            elif config_peripheral["type"] == "BerryClip Buzzer":
+                handler, pins = berryclip_buzzer, (PWM(Pin(config_peripheral["pins"][0], Pin.OUT)), Lock())
+            elif config_peripheral["type"] == "BerryClip Led":
+                handler, pins = berryclip_led, (Pin(config_subtype["pins"][0], Pin.OUT), Pin(config_subtype["pins"][1], Pin.OUT))
+            else:
+                continue
+            status_topic = (config["mqtt"]["topic"] + "/" + suffix + "/get").encode() if "get" in config_peripheral["actions"] else None
+            peripherals[suffix] = (handler, (pins, status_topic, config_subtype["topic"] if config_subtype else ""), config_peripheral["actions"] == ["get"])
+    return peripherals
 
 """
-Subscribes to topics.
+Subscribes to topics, building the handlers table used to dispatch them, and publishes current status of every peripheral with get action.
 """
 
 def subscribing(client):
-    from ujson import load
-    with open("config.json") as config_file:
-        config = load(config_file)
-        for config_peripheral in config["peripherals"]["internal"]:
-            client.subscribe(f"{client.client_id}/" + config_peripheral["type"].lower().replace(" ", "_"), qos=1)
-            print("Suscribed to " + f"{client.client_id}/" + config_peripheral["type"].lower().replace(" ", "_"))
-        for config_peripheral in config["peripherals"]["external"]:
-            if "subtypes" in config_peripheral:
-                for subtype in config_peripheral["subtypes"]:
-                    client.subscribe(f"{client.client_id}/" + config_peripheral["type"].lower().replace(" ", "_") + "/" + subtype["subtype"].lower().replace(" ", "_"), qos=1)
-                    print("Suscribed to " + f"{client.client_id}/" + config_peripheral["type"].lower().replace(" ", "_") + "/" + subtype["subtype"].lower().replace(" ", "_"))
-            else:
-                client.subscribe(f"{client.client_id}/" + config_peripheral["type"].lower().replace(" ", "_"), qos=1)
-                print("Suscribed to " + f"{client.client_id}/" + config_peripheral["type"].lower().replace(" ", "_"))
-
-"""
-Connects to the wifi network.
+    global topic_handlers
+    topic_handlers = {}
+    for suffix, (handler, peripheral, _) in peripherals.items():
+        topic = f"{client.client_id}/{suffix}"
+        topic_handlers[topic.encode()] = (handler, peripheral)
+        client.subscribe(topic, qos=1)
+        print("Suscribed to " + topic)
+        if peripheral[1] is not None:
+            handler(peripheral, b"get")
+
+"""
+Connects to the wifi network, sleeping between connection checks.
 @param wifi_ssid: Network SSID
 @param wifi_password: Network password
 """
 
 def wifi_connect(wifi_ssid, wifi_password):
     from network import WLAN, STA_IF
+    from time import sleep_ms
     wlan = WLAN(STA_IF)
     if not wlan.isconnected():
         print("Connecting to wifi...")
         wlan.active(True)
         wlan.connect(wifi_ssid, wifi_password)
         while not wlan.isconnected():
-            pass
+            sleep_ms(WIFI_WAIT)
     print("Connected to wifi")
 
 """
-Connects to the MQTT broker.
+Connects to the MQTT broker, waiting without blocking other tasks between attempts.
 @param client: MQTT client
 """
 
-def mqtt_connect(client):
-    from time import sleep
+async def mqtt_connect(client):
+    from uasyncio import sleep
     print("Connecting to broker...")
     while True:
         try:
             client.connect()
             break
         except OSError:
-            sleep(1)
-    integrated_led("on")
+            await sleep(1)
+    integrated_led(peripherals["integrated_led"][1], b"on")
     print("Connected to broker")
 
 """
-Initialize MQTT client.
+Initialize MQTT client and peripherals table. Config is only read here.
 @returns: MQTT client
 """
 
 def main_initialize():
+    global peripherals
     from ujson import load
     from umqtt.simple import MQTTClient
     with open("config.json") as config_file:
         config = load(config_file)
+        peripherals = load_peripherals(config)
         wifi_connect(config["wifi"]["ssid"], config["wifi"]["password"])
-        client_id = config["mqtt"]["room"].lower().replace(" ", "_") + "/" + config["mqtt"]["position"].lower().replace(" ", "_")
-        client = MQTTClient(client_id, config["mqtt"]["server"], user=config["mqtt"]["user"], password=config["mqtt"]["password"])
+        client_id = config["mqtt"]["topic"]
+        client = MQTTClient(client_id, config["mqtt"]["server"], user=config["mqtt"]["user"], password=config["mqtt"]["password"], keepalive=MQTT_KEEPALIVE)
         client.set_callback(callback)
     return client
 
 """
-Runs MQTT forever.
+Sends MQTT keepalive pings forever.
 @param client: MQTT client
 """
 
-def main_loop(client):
-    from machine import reset
-    try:
-        while True:
-            try:
-                client.check_msg()
-            except OSError:
-                integrated_led("off")
-                mqtt_connect(client)
-                subscribing(client)
-    except KeyboardInterrupt:
-        reset()
+async def keep_alive(client):
+    from uasyncio import sleep_ms
+    while True:
+        await sleep_ms(MQTT_KEEPALIVE * 500)
+        try:
+            client.ping()
+        except OSError:
+            pass
+
+"""
+Publishes sensors values every SENSORS_INTERVAL seconds forever.
+"""
+
+async def sample_sensors():
+    from uasyncio import sleep
+    while True:
+        await sleep(SENSORS_INTERVAL)
+        for handler, peripheral, sampled in peripherals.values():
+            if sampled:
+                handler(peripheral, b"get")
+
+"""
+Runs MQTT forever. Messages are read as soon as the socket is readable, or right away if already received in the MQTT client buffer, while keepalive pings, sensors sampling and peripheral actions run as other tasks. The connection is considered lost if nothing is received within 1.5 times MQTT_KEEPALIVE.
+@param client: MQTT client
+"""
+
+async def main_loop(client):
+    from uasyncio import create_task, StreamReader, TimeoutError, wait_for_ms
+    await mqtt_connect(client)
+    subscribing(client)
+    create_task(keep_alive(client))
+    create_task(sample_sensors())
+    while True:
+        try:
+            reader = StreamReader(client.sock)
+            while True:
+                client.process_msg(None if client.any() else await wait_for_ms(reader.read(1), MQTT_KEEPALIVE * 1500))
+        except (OSError, TimeoutError):
+            integrated_led(peripherals["integrated_led"][1], b"off")
+            client.sock.close()
+            await mqtt_connect(client)
+            subscribing(client)
 
 """
 Main.
 """
 
 if __name__ == "__main__":
+    from machine import reset
+    from uasyncio import run
     client = main_initialize()
-    mqtt_connect(client)
-    subscribing(client)
-    main_loop(client)
+    try:
+        run(main_loop(client))
+    except KeyboardInterrupt:
+        reset()
@@ -26,6 +26,67 @@ class MQTTClient:
         self.lw_msg = None
         self.lw_qos = 0
         self.lw_retain = False
+        self.wbuf = bytearray(128)
+        self.rbuf = bytearray(128)
+        self.rmv = memoryview(self.rbuf)
+        self.rpos = 0
+        self.rend = 0
+        self.ackbuf = bytearray(b"\x40\x02\0\0")
+
+    # Get the preallocated send buffer, growing it if a packet
+    # of the given size does not fit.
+    def _wbuf(self, sz):
+        if len(self.wbuf) < sz:
+            self.wbuf = bytearray(sz)
+        return self.wbuf
+
+    # Pack a remaining length into a send buffer.
+    # Returns the index following it.
+    def _pack_len(self, pkt, i, sz):
+        while sz > 0x7f:
+            pkt[i] = (sz & 0x7f) | 0x80
+            sz >>= 7
+            i += 1
+        pkt[i] = sz
+        return i + 1
+
+    # Pack a length-prefixed string into a send buffer.
+    # Returns the index following it.
+    def _pack_str(self, pkt, i, s):
+        struct.pack_into("!H", pkt, i, len(s))
+        pkt[i + 2:i + 2 + len(s)] = s
+        return i + 2 + len(s)
+
+    # Read exactly n bytes. Missing bytes are read blocking with
+    # their exact length, as a blocking readinto only returns once
+    # it filled what it was given. Whatever else the socket already
+    # has available is then read without blocking into a receive
+    # buffer, so following headers and small packets take no more
+    # socket reads.
+    def _read(self, n):
+        if self.rend - self.rpos >= n:
+            self.rpos += n
+            return bytes(self.rmv[self.rpos - n:self.rpos])
+        data = bytearray(n)
+        got = self.rend - self.rpos
+        data[:got] = self.rmv[self.rpos:self.rend]
+        self.rpos = self.rend = 0
+        while got < n:
+            r = self.sock.readinto(memoryview(data)[got:], n - got)
+            if not r:
+                raise OSError(-1)
+            got += r
+        self.sock.setblocking(False)
+        try:
+            self.rend = self.sock.readinto(self.rmv) or 0
+        except OSError:
+            self.rend = 0
+        self.sock.setblocking(True)
+        return bytes(data)
+
+    # Number of received bytes buffered and not processed yet.
+    def any(self):
+        return self.rend - self.rpos
 
     def _send_str(self, s):
         self.sock.write(struct.pack("!H", len(s)))
@@ -35,7 +96,7 @@ class MQTTClient:
         n = 0
         sh = 0
         while 1:
-            b = self.sock.read(1)[0]
+            b = self._read(1)[0]
             n |= (b & 0x7f) << sh
             if not b & 0x80:
                 return n
@@ -53,6 +114,7 @@ class MQTTClient:
         self.lw_retain = retain
 
     def connect(self, clean_session=True):
+        self.rpos = self.rend = 0
         self.sock = socket.socket()
         addr = socket.getaddrinfo(self.server, self.port)[0][-1]
         self.sock.connect(addr)
@@ -93,7 +155,7 @@ class MQTTClient:
         if self.user is not None:
             self._send_str(self.user)
             self._send_str(self.pswd)
-        resp = self.sock.read(4)
+        resp = self._read(4)
         assert resp[0] == 0x20 and resp[1] == 0x02
         if resp[3] != 0:
             raise MQTTException(resp[3])
@@ -106,35 +168,36 @@ class MQTTClient:
     def ping(self):
         self.sock.write(b"\xc0\0")
 
+    # Assemble the whole packet in the send buffer and write it
+    # at once, so it is not split into several TCP segments.
     def publish(self, topic, msg, retain=False, qos=0):
-        pkt = bytearray(b"\x30\0\0\0")
-        pkt[0] |= qos << 1 | retain
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(msg, str):
+            msg = msg.encode()
         sz = 2 + len(topic) + len(msg)
         if qos > 0:
             sz += 2
         assert sz < 2097152
-        i = 1
-        while sz > 0x7f:
-            pkt[i] = (sz & 0x7f) | 0x80
-            sz >>= 7
-            i += 1
-        pkt[i] = sz
-        #print(hex(len(pkt)), hexlify(pkt, ":"))
-        self.sock.write(pkt, i + 1)
-        self._send_str(topic)
+        pkt = self._wbuf(sz + 4)
+        pkt[0] = 0x30 | qos << 1 | retain
+        i = self._pack_len(pkt, 1, sz)
+        i = self._pack_str(pkt, i, topic)
         if qos > 0:
             self.pid += 1
             pid = self.pid
-            struct.pack_into("!H", pkt, 0, pid)
-            self.sock.write(pkt, 2)
-        self.sock.write(msg)
+            struct.pack_into("!H", pkt, i, pid)
+            i += 2
+        pkt[i:i + len(msg)] = msg
+        #print(hex(i + len(msg)), hexlify(pkt[:i + len(msg)], ":"))
+        self.sock.write(pkt, i + len(msg))
         if qos == 1:
             while 1:
                 op = self.wait_msg()
                 if op == 0x40:
-                    sz = self.sock.read(1)
+                    sz = self._read(1)
                     assert sz == b"\x02"
-                    rcv_pid = self.sock.read(2)
+                    rcv_pid = self._read(2)
                     rcv_pid = rcv_pid[0] << 8 | rcv_pid[1]
                     if pid == rcv_pid:
                         return
@@ -143,19 +206,25 @@ class MQTTClient:
 
     def subscribe(self, topic, qos=0):
         assert self.cb is not None, "Subscribe callback is not set"
-        pkt = bytearray(b"\x82\0\0\0")
+        if isinstance(topic, str):
+            topic = topic.encode()
+        sz = 2 + 2 + len(topic) + 1
+        pkt = self._wbuf(sz + 4)
+        pkt[0] = 0x82
+        i = self._pack_len(pkt, 1, sz)
         self.pid += 1
-        struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, self.pid)
-        #print(hex(len(pkt)), hexlify(pkt, ":"))
-        self.sock.write(pkt)
-        self._send_str(topic)
-        self.sock.write(qos.to_bytes(1, "little"))
+        pid = self.pid
+        struct.pack_into("!H", pkt, i, pid)
+        i = self._pack_str(pkt, i + 2, topic)
+        pkt[i] = qos
+        #print(hex(i + 1), hexlify(pkt[:i + 1], ":"))
+        self.sock.write(pkt, i + 1)
         while 1:
             op = self.wait_msg()
             if op == 0x90:
-                resp = self.sock.read(4)
+                resp = self._read(4)
                 #print(resp)
-                assert resp[1] == pkt[2] and resp[2] == pkt[3]
+                assert resp[1] << 8 | resp[2] == pid
                 if resp[3] == 0x80:
                     raise MQTTException(resp[3])
                 return
@@ -165,34 +234,45 @@ class MQTTClient:
     # set by .set_callback() method. Other (internal) MQTT
     # messages processed internally.
     def wait_msg(self):
+        if self.any():
+            self.sock.setblocking(True)
+            return self.process_msg()
         res = self.sock.read(1)
         self.sock.setblocking(True)
         if res is None:
             return None
+        return self.process_msg(res)
+
+    # Process a single incoming MQTT message. Its first byte is
+    # read from the receive buffer unless it was already read,
+    # e.g. by an asynchronous stream once the socket became
+    # readable, which must only happen when .any() is 0.
+    def process_msg(self, res=None):
+        if res is None:
+            res = self._read(1)
         if res == b"":
             raise OSError(-1)
         if res == b"\xd0":  # PINGRESP
-            sz = self.sock.read(1)[0]
+            sz = self._read(1)[0]
             assert sz == 0
             return None
         op = res[0]
         if op & 0xf0 != 0x30:
             return op
         sz = self._recv_len()
-        topic_len = self.sock.read(2)
+        topic_len = self._read(2)
         topic_len = (topic_len[0] << 8) | topic_len[1]
-        topic = self.sock.read(topic_len)
+        topic = self._read(topic_len)
         sz -= topic_len + 2
         if op & 6:
-            pid = self.sock.read(2)
+            pid = self._read(2)
             pid = pid[0] << 8 | pid[1]
             sz -= 2
-        msg = self.sock.read(sz)
+        msg = self._read(sz)
         self.cb(topic, msg)
         if op & 6 == 2:
-            pkt = bytearray(b"\x40\x02\0\0")
-            struct.pack_into("!H", pkt, 2, pid)
-            self.sock.write(pkt)
+            struct.pack_into("!H", self.ackbuf, 2, pid)
+            self.sock.write(self.ackbuf)
         elif op & 6 == 4:
             assert 0
 
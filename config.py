@@ -4,7 +4,7 @@ from ast import literal_eval
 from Common.commands import create_local_command, create_remote_command, edit_local_command, edit_remote_command, get_local_command, get_local_commands, get_remote_command, get_remote_commands, remove_local_command, remove_remote_command
 from Common.constants import BLUE, DEFAULT, RED, YELLOW
 from Common.devices import create_device, edit_device, get_devices, install_device, remove_device
-from Common.general import get_legal_age, get_wifi_password, get_wifi_ssid, set_legal_age, set_wifi_credentials
+from Common.general import get_face_workers, get_legal_age, get_wifi_password, get_wifi_ssid, set_face_workers, set_legal_age, set_wifi_credentials
 from Common.languages import get_default_language, get_installed_languages, set_default_language
 from Common.peripherals import assign_external_peripheral, deassign_external_peripheral, get_device_peripherals, get_external_peripherals, get_internal_peripherals, get_peripheral_actions, get_peripheral_subtypes
 from Common.positions import create_position, edit_position, get_positions, remove_position
@@ -75,6 +75,17 @@ class Config(Tk):
         self.general_wifi_credentials_set_button = Button(self.general_3_frame, text="Set", command=lambda: Config.gui_set_wifi_credentials(self))
         self.general_wifi_credentials_set_button.pack(side=LEFT, padx=10)
 
+        self.general_4_frame = Frame(self.general_frame)
+        self.general_4_frame.pack(side=TOP, pady=10)
+
+        self.general_face_workers_label = Label(self.general_4_frame, text="Face Workers")
+        self.general_face_workers_label.pack(side=LEFT, padx=10)
+        self.general_face_workers_entry = Entry(self.general_4_frame)
+        self.general_face_workers_entry.insert(0, get_face_workers())
+        self.general_face_workers_entry.pack(side=LEFT, padx=10)
+        self.general_face_workers_set_button = Button(self.general_4_frame, text="Set", command=lambda: Config.gui_set_face_workers(self))
+        self.general_face_workers_set_button.pack(side=LEFT, padx=10)
+
         # TODO: Add automatic start on boot option
 
         # Users
@@ -456,6 +467,13 @@ class Config(Tk):
     def gui_set_legal_age(self):
         set_legal_age(self.general_legal_age_entry.get())
 
+    """
+    Sets face workers in graphical mode.
+    """
+
+    def gui_set_face_workers(self):
+        set_face_workers(self.general_face_workers_entry.get())
+
     """
     Sets wifi credentials in graphical mode.
     """
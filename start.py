@@ -1,25 +1,37 @@
 #!/usr/bin/env python3
 
 from chime import info, success, warning
-from Common.commands import get_command
-from Common.constants import BLUE, COMMAND_TIMEOUT, DEFAULT, ENCODED_FACES_EXTENSION, ENCODED_FACES_PATH, GREEN, LANGUAGES_PATH, RED, YELLOW
-from Common.devices import get_devices
-from Common.general import get_mqtt_user, get_mqtt_password
-from Common.languages import get_default_language, get_default_language_paths
-from Common.peripherals import get_device_peripherals, get_peripheral_actions, get_peripheral_subtypes
+from Common.commands import get_command, get_responses
+from Common.constants import AUDIO_BUFFER_CHUNKS, AUDIO_CHUNK, AUDIO_RATE, AUDIO_TIMEOUT, BLUE, COMMAND_RESULTS, COMMAND_TIMEOUT, COMMAND_WORKERS, DEFAULT, ENCODED_FACES_EXTENSION, ENCODED_FACES_PATH, FACE_TOLERANCE, FRAME_TIMEOUT, GREEN, LANGUAGES_PATH, MOTION_AREA, MOTION_DETECTION_INTERVAL, MOTION_PIXEL_THRESHOLD, PERIPHERAL_STATE_MAX_AGE, RED, RESPONSES_CACHE_SIZE, RESPONSES_EXTENSION, RESPONSES_PATH, SENSOR_TOPICS, SPEECH_SPEED, TELEMETRY_PATH, TRACK_ENCODING_INTERVAL, TRACK_OVERLAP, VAD_ENERGY_RATIO, VAD_HANGOVER_CHUNKS, VAD_MIN_ENERGY, VAD_NOISE_ADAPTATION, VAD_PREROLL_CHUNKS, VAD_ZERO_CROSSING_RATE, YELLOW
+from Common.general import get_face_workers, get_mqtt_user, get_mqtt_password
+from Common.languages import get_languages_paths
+from Common.peripherals import get_peripheral_actions, get_sensor
+from Common.telemetry import TelemetryStore, telemetry_value
 from Common.users import get_users, get_user_permissions
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from cv2 import CAP_V4L2, resize, VideoCapture
-from face_recognition import compare_faces, face_distance, face_encodings, face_locations
-from numpy import argmin, load as numpy_load
-from os import devnull, path
+from cv2 import absdiff, CAP_PROP_BUFFERSIZE, CAP_V4L2, COLOR_BGR2GRAY, countNonZero, cvtColor, GaussianBlur, resize, threshold, THRESH_BINARY, VideoCapture
+from face_recognition import face_encodings, face_locations
+from hashlib import sha1
+from heapq import heappop, heappush
+from io import BytesIO
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from numpy import arange, argmin, array, count_nonzero, diff, float32, float64, frombuffer, int16, load as numpy_load, mean, ndarray, newaxis, signbit, sqrt, stack, uint8
+from numpy.linalg import norm
+from os import devnull, killpg, makedirs, path, replace
 from paho.mqtt.client import Client, MQTTv5
 from pocketsphinx import Config, Decoder
-from pyaudio import paInt16, PyAudio
+from pyaudio import paContinue, paInputOverflow, paInt16, PyAudio
+from queue import Full, Queue
+from shlex import split
+from signal import SIG_IGN, SIGINT, SIGKILL, signal
 from socket import gethostname
-from subprocess import Popen
-from threading import Event, Lock, Thread
-from time import sleep, time
+from subprocess import DEVNULL, Popen, run, TimeoutExpired
+from threading import Condition, Event, Lock, Thread
+from time import monotonic, time
+from wave import open as wave_open
 
 """
 Removes alsa lib irrelevant errors.
@@ -41,7 +53,7 @@ def alsa_error():
         os.close(old_stderr)
 
 """
-Pending commands structure.
+Pending commands structure. Commands are bucketed by permission class, each bucket being a min-heap by deadline, so a user only looks at the buckets of the permission classes they are allowed to and each command expires exactly COMMAND_TIMEOUT seconds after it was added.
 """
 
 class PendingCommands:
@@ -51,60 +63,700 @@ class PendingCommands:
     """
 
     def __init__(self):
-        self.pending_commands = []
-        self.lock = Lock()
+        self.pending_commands = [[] for _ in range(4)]
+        self.pending_keys = set()
+        self.sequence = 0
+        self.condition = Condition()
         self.t_pending_commands = Thread(target=self.remove_timed_out)
         self.t_pending_commands.daemon = True
         self.t_pending_commands.start()
 
     """
-    Add a pending command.
+    Add a pending command if it is not already pending.
     @param config_command: Command
     @param language: Language
+    @returns: True if command was added. False if it was already pending
     """
 
     def append(self, config_command, language):
+        key = command_key(config_command)
+        with self.condition:
+            if key in self.pending_keys:
+                return False
+            heappush(self.pending_commands[permission_class(config_command["age_restriction"], config_command["privileged"])], (monotonic() + COMMAND_TIMEOUT, self.sequence, config_command, language))
+            self.pending_keys.add(key)
+            self.sequence += 1
+            self.condition.notify()
+            return True
+
+    """
+    Takes every pending command of the allowed permission classes.
+    @param mask: Allowed permission classes mask
+    @returns: A list with a tuple with command and language for each taken command, in the order they were added
+    """
+
+    def drain(self, mask):
+        drained = []
+        with self.condition:
+            current_time = monotonic()
+            for command_class in range(4):
+                if mask & (1 << command_class) and self.pending_commands[command_class]:
+                    for pending_command in self.pending_commands[command_class]:
+                        self.pending_keys.discard(command_key(pending_command[2]))
+                        if pending_command[0] > current_time:
+                            drained.append(pending_command)
+                    self.pending_commands[command_class] = []
+        return [(config_command, language) for _, _, config_command, language in sorted(drained, key=lambda pending_command: pending_command[1])]
+
+    """
+    Count pending command.
+    @returns: Pending command count
+    """
+
+    def len(self):
+        with self.condition:
+            return sum(len(bucket) for bucket in self.pending_commands)
+
+    """
+    Delete timed out pending command as soon as its deadline is reached.
+    """
+
+    def remove_timed_out(self):
+        with self.condition:
+            while True:
+                current_time = monotonic()
+                for bucket in self.pending_commands:
+                    while bucket and bucket[0][0] <= current_time:
+                        self.pending_keys.discard(command_key(heappop(bucket)[2]))
+                deadlines = [bucket[0][0] for bucket in self.pending_commands if bucket]
+                if deadlines:
+                    self.condition.wait(min(deadlines) - monotonic())
+                else:
+                    self.condition.wait()
+
+"""
+Debouncer structure. Coalesces repeated hits of the same command within its debounce window.
+"""
+
+class Debouncer:
+
+    """
+    Constructs debouncer structure.
+    """
+
+    def __init__(self):
+        self.last_hits = {}
+        self.lock = Lock()
+
+    """
+    Registers a command hit.
+    @param config_command: Command
+    @returns: True if command should be executed. False if it was already hit within its debounce window
+    """
+
+    def hit(self, config_command):
+        key = command_key(config_command)
+        current_time = monotonic()
         with self.lock:
-            self.pending_commands.append((config_command, language, time()))
+            last_hit = self.last_hits.get(key)
+            if last_hit is not None and current_time - last_hit < config_command["debounce"]:
+                return False
+            self.last_hits[key] = current_time
+            return True
+
+"""
+Last known peripheral states structure. States come from sensor publications, including retained ones, and from commands sent, so they are known without asking the device until they are PERIPHERAL_STATE_MAX_AGE seconds old.
+"""
+
+class PeripheralStates:
+
+    """
+    Constructs last known peripheral states structure.
+    """
+
+    def __init__(self):
+        self.states = {}
+        self.lock = Lock()
 
     """
-    Get a pending command.
-    @param index: Index
-    @returns: A tuple with command and language
+    Updates a peripheral state.
+    @param topic: Peripheral topic
+    @param state: State
     """
 
-    def get(self, index):
+    def update(self, topic, state):
         with self.lock:
-            return (self.pending_commands[index][0], self.pending_commands[index][1])
+            self.states[topic] = (state, time())
 
     """
-    Delete a pending command.
-    @param index: Index
+    Gets a peripheral state if it is recent enough to be trusted.
+    @param topic: Peripheral topic
+    @returns: A tuple with state and time it was known. None if state is unknown or older than PERIPHERAL_STATE_MAX_AGE seconds
     """
 
-    def remove(self, index):
+    def get(self, topic):
         with self.lock:
-            del self.pending_commands[index]
+            state = self.states.get(topic)
+        if state is None or time() - state[1] > PERIPHERAL_STATE_MAX_AGE:
+            return None
+        return state
+
+"""
+Local commands executor structure. Runs commands in a bounded number of threads, killing those lasting more than COMMAND_TIMEOUT and keeping their exit status.
+"""
+
+class CommandExecutor:
 
     """
-    Count pending command.
-    @returns: Pending command count
+    Constructs local commands executor structure.
+    @param workers: Maximum number of commands running at the same time
     """
 
-    def len(self):
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = workers * 2
+        self.pending = 0
+        self.results = deque(maxlen=COMMAND_RESULTS)
+        self.lock = Lock()
+
+    """
+    Queues a command to be executed.
+    @param command: Local command
+    @returns: True if command was queued. False if too many commands are pending
+    """
+
+    def submit(self, command):
         with self.lock:
-            return len(self.pending_commands)
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+        self.executor.submit(self.run, command)
+        return True
 
     """
-    Delete timed out pending command.
+    Runs a command until it ends or times out. Commands without shell syntax are executed directly.
+    @param command: Local command
     """
 
-    def remove_timed_out(self):
-        while True:
-            sleep(COMMAND_TIMEOUT)
+    def run(self, command):
+        try:
+            argv = command_argv(command)
+            process = Popen(argv if argv else command, shell=not argv, stdin=DEVNULL, start_new_session=True)
+            try:
+                returncode = process.wait(COMMAND_TIMEOUT)
+            except TimeoutExpired:
+                killpg(process.pid, SIGKILL)
+                process.wait()
+                returncode = None
+        except OSError:
+            returncode = 127
+        finally:
             with self.lock:
-                current_time = time()
-                self.pending_commands = [(config_command, language, timestamp) for config_command, language, timestamp in self.pending_commands if current_time - timestamp < COMMAND_TIMEOUT]
+                self.pending -= 1
+        self.results.append((command, returncode))
+        if returncode is None:
+            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Timed out: {command}{DEFAULT}")
+        elif returncode != 0:
+            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Failed with exit status {returncode}: {command}{DEFAULT}")
+
+    """
+    Stops executing queued commands. Running commands are left until they end or time out.
+    """
+
+    def stop(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+"""
+Gets command arguments when command can be executed without shell.
+@param command: Local command
+@returns: A list with command arguments. False if command needs a shell
+"""
+
+def command_argv(command):
+    if any(char in "|&;<>()$`\\*?[]{}~#=%!\n" for char in command):
+        return False
+    try:
+        return split(command) or False
+    except ValueError:
+        return False
+
+"""
+Speaker structure. Responses are synthesized once, kept as WAV files on disk and in a memory LRU cache, and played in order through a single audio output stream.
+"""
+
+class Speaker:
+
+    """
+    Constructs speaker structure.
+    """
+
+    def __init__(self):
+        self.responses = OrderedDict()
+        self.lock = Lock()
+        self.synthesis_lock = Lock()
+        self.queued_responses = Queue()
+        self.t_speaker = Thread(target=self.play)
+        self.t_speaker.daemon = True
+        self.t_speaker.start()
+
+    """
+    Gets a synthesized response from memory, disk or espeak, in that order.
+    @param response: Response
+    @param language: Language
+    @returns: Response as WAV. None if could not be synthesized
+    """
+
+    def synthesize(self, response, language):
+        key = (response, language, SPEECH_SPEED)
+        with self.lock:
+            if key in self.responses:
+                self.responses.move_to_end(key)
+                return self.responses[key]
+        file_path = RESPONSES_PATH + sha1(repr(key).encode()).hexdigest() + RESPONSES_EXTENSION
+        with self.synthesis_lock:
+            if not path.isfile(file_path):
+                makedirs(RESPONSES_PATH, exist_ok=True)
+                try:
+                    if run(["espeak", "-s", str(SPEECH_SPEED), "-v", language, "-w", file_path + ".tmp", response], stdout=DEVNULL, stderr=DEVNULL).returncode != 0:
+                        return None
+                except OSError:
+                    return None
+                replace(file_path + ".tmp", file_path)
+            with open(file_path, "rb") as response_file:
+                wav = response_file.read()
+        with self.lock:
+            self.responses[key] = wav
+            if len(self.responses) > RESPONSES_CACHE_SIZE:
+                self.responses.popitem(last=False)
+        return wav
+
+    """
+    Synthesizes responses in advance.
+    @param responses: A list with a tuple with response and language for each response
+    """
+
+    def warm(self, responses):
+        for response, language in responses:
+            self.synthesize(response, language)
+
+    """
+    Queues a response to be spoken.
+    @param response: Response
+    @param language: Language
+    """
+
+    def say(self, response, language):
+        self.queued_responses.put((response, language))
+
+    """
+    Stops speaking and waits until speaker thread ends.
+    """
+
+    def stop(self):
+        self.queued_responses.put(None)
+        self.t_speaker.join()
+
+    """
+    Plays queued responses until stopped. Output stream is only reopened when WAV format changes.
+    """
+
+    def play(self):
+        with alsa_error():
+            audio = PyAudio()
+        stream, stream_format = None, None
+        while True:
+            queued_response = self.queued_responses.get()
+            if queued_response is None:
+                break
+            wav = self.synthesize(*queued_response)
+            if not wav:
+                print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Cannot synthesize response{DEFAULT}")
+                continue
+            with wave_open(BytesIO(wav), "rb") as wav_file:
+                wav_format = (wav_file.getsampwidth(), wav_file.getnchannels(), wav_file.getframerate())
+                frames = wav_file.readframes(wav_file.getnframes())
+            if wav_format != stream_format:
+                if stream is not None:
+                    stream.close()
+                stream = audio.open(format=audio.get_format_from_width(wav_format[0]), channels=wav_format[1], rate=wav_format[2], output=True)
+                stream_format = wav_format
+            stream.write(frames)
+        if stream is not None:
+            stream.close()
+        audio.terminate()
+
+"""
+Audio ring buffer structure. Captured chunks are copied into a preallocated buffer, so capture never waits for decoding.
+"""
+
+class AudioBuffer:
+
+    """
+    Constructs audio ring buffer structure.
+    @param chunks: Number of chunks the buffer can hold
+    @param chunk_size: Chunk size in bytes
+    """
+
+    def __init__(self, chunks, chunk_size):
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.buffer = bytearray(chunks * chunk_size)
+        self.written = 0
+        self.read_count = 0
+        self.dropped = 0
+        self.overflows = 0
+        self.condition = Condition()
+
+    """
+    Stores a captured chunk. If the buffer is full, oldest chunk is dropped.
+    @param chunk: Audio chunk
+    @param overflow: True if audio input overflowed before this chunk. False if not
+    """
+
+    def write(self, chunk, overflow):
+        with self.condition:
+            if overflow:
+                self.overflows += 1
+            if self.written - self.read_count >= self.chunks:
+                self.read_count += 1
+                self.dropped += 1
+            offset = (self.written % self.chunks) * self.chunk_size
+            self.buffer[offset:offset + len(chunk)] = chunk
+            self.written += 1
+            self.condition.notify()
+
+    """
+    Stores a chunk captured by the audio stream. Runs in the audio stream thread.
+    @param in_data: Audio chunk
+    @param frame_count: Number of frames in chunk
+    @param time_info: Capture time information
+    @param status: Audio stream status flags
+    @returns: A tuple with no output data and continue flag
+    """
+
+    def capture(self, in_data, frame_count, time_info, status):
+        self.write(in_data, bool(status & paInputOverflow))
+        return (None, paContinue)
+
+    """
+    Takes oldest unread chunk, waiting for a new one if there is none.
+    @param timeout: Maximum seconds to wait
+    @returns: Audio chunk. None if there is no new chunk before timeout
+    """
+
+    def read(self, timeout):
+        with self.condition:
+            if self.read_count == self.written:
+                self.condition.wait(timeout)
+                if self.read_count == self.written:
+                    return None
+            offset = (self.read_count % self.chunks) * self.chunk_size
+            self.read_count += 1
+            return bytes(self.buffer[offset:offset + self.chunk_size])
+
+"""
+Voice activity detection structure. Uses energy and zero crossing rate against an adaptive noise floor, keeping some silent chunks so speech onsets are not clipped.
+"""
+
+class VoiceActivityDetector:
+
+    """
+    Constructs voice activity detection structure.
+    """
+
+    def __init__(self):
+        self.noise_energy = None
+        self.hangover = 0
+        self.preroll = deque(maxlen=VAD_PREROLL_CHUNKS)
+
+    """
+    Checks if speech is in progress.
+    @returns: True if last processed chunks had speech. False if not
+    """
+
+    def speaking(self):
+        return self.hangover > 0
+
+    """
+    Processes an audio chunk.
+    @param chunk: Audio chunk
+    @returns: A list with chunks to be decoded. Empty if chunk is silence
+    """
+
+    def process(self, chunk):
+        samples = frombuffer(chunk, dtype=int16).astype(float32)
+        energy = float(sqrt(mean(samples * samples)))
+        zero_crossing_rate = count_nonzero(diff(signbit(samples))) / len(samples)
+        if self.noise_energy is None:
+            self.noise_energy = energy
+        threshold = max(VAD_MIN_ENERGY, self.noise_energy * VAD_ENERGY_RATIO)
+        if energy >= threshold or (energy >= threshold / 2 and zero_crossing_rate >= VAD_ZERO_CROSSING_RATE):
+            self.hangover = VAD_HANGOVER_CHUNKS
+            chunks = list(self.preroll) + [chunk]
+            self.preroll.clear()
+            return chunks
+        self.noise_energy += (energy - self.noise_energy) * VAD_NOISE_ADAPTATION
+        if self.hangover > 0:
+            self.hangover -= 1
+            return [chunk]
+        self.preroll.append(chunk)
+        return []
+
+"""
+Speech decoder structure. Decodes one language in its own thread, so every installed language is spotted from the same captured chunks.
+"""
+
+class SpeechDecoder:
+
+    """
+    Constructs speech decoder structure.
+    @param language: Language
+    @param language_paths: A tuple with Hidden Markov Model, dictionary and keywords paths
+    """
+
+    def __init__(self, language, language_paths):
+        hmm_path, dic_path, kws_path = language_paths
+        self.language = language
+        self.decoder = Decoder(Config(lm=None, hmm=path.join(LANGUAGES_PATH, language, hmm_path), dict=path.join(LANGUAGES_PATH, language, dic_path), kws=path.join(LANGUAGES_PATH, language, kws_path), logfn=devnull))
+        self.chunks = Queue(AUDIO_BUFFER_CHUNKS)
+        self.dropped = 0
+        self.t_decoder = Thread(target=self.decode)
+        self.t_decoder.daemon = True
+
+    """
+    Starts decoding.
+    """
+
+    def start(self):
+        self.t_decoder.start()
+
+    """
+    Queues chunks to be decoded. The same chunks are shared by every decoder. If decoder is too far behind, chunks are dropped.
+    @param chunks: A list with audio chunks. Empty if speech has ended
+    """
+
+    def feed(self, chunks):
+        try:
+            self.chunks.put_nowait(chunks)
+        except Full:
+            self.dropped += len(chunks)
+
+    """
+    Stops decoding and waits until decoder thread ends.
+    """
+
+    def stop(self):
+        self.chunks.put(None)
+        self.t_decoder.join()
+
+    """
+    Decodes queued chunks until stopped.
+    """
+
+    def decode(self):
+        self.decoder.start_utt()
+        while True:
+            chunks = self.chunks.get()
+            if chunks is None:
+                break
+            for chunk in chunks:
+                self.decoder.process_raw(chunk, False, False)
+            if chunks and self.decoder.hyp() is not None:
+                phrase = self.decoder.hyp().hypstr.strip()
+                print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}You said ({self.language}): {DEFAULT}{phrase}")
+                action(phrase, self.language)
+                self.decoder.end_utt()
+                self.decoder.start_utt()
+            elif not chunks:
+                self.decoder.end_utt()
+                self.decoder.start_utt()
+        self.decoder.end_utt()
+
+"""
+Latest camera frame structure. Only the freshest frame is kept, so a slow consumer never processes stale frames.
+"""
+
+class LatestFrame:
+
+    """
+    Constructs latest frame structure.
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.closed = False
+        self.condition = Condition()
+
+    """
+    Replaces latest frame.
+    @param frame: Frame
+    """
+
+    def put(self, frame):
+        with self.condition:
+            self.frame = frame
+            self.condition.notify()
+
+    """
+    Takes latest frame, waiting for a new one if it was already taken.
+    @param timeout: Maximum seconds to wait
+    @returns: Latest frame. None if there is no new frame before timeout or capture is closed
+    """
+
+    def get(self, timeout):
+        with self.condition:
+            if self.frame is None and not self.closed:
+                self.condition.wait(timeout)
+            frame = self.frame
+            self.frame = None
+            return frame
+
+    """
+    Marks capture as closed.
+    """
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+"""
+Face tracking structure. Associates found faces with those of the previous detection, so known faces keep their identity without being encoded again.
+"""
+
+class FaceTracker:
+
+    """
+    Constructs face tracking structure.
+    """
+
+    def __init__(self):
+        self.tracks = []
+
+    """
+    Associates found faces with previous tracks by overlap.
+    @param found_faces: Found faces locations
+    @returns: A list with a track for each found face. Each track has location, name and last encoding time
+    """
+
+    def track(self, found_faces):
+        tracks = []
+        previous_tracks = list(self.tracks)
+        for found_face in found_faces:
+            best_track, best_overlap = None, TRACK_OVERLAP
+            for previous_track in previous_tracks:
+                overlap = intersection_over_union(found_face, previous_track["location"])
+                if overlap >= best_overlap:
+                    best_track, best_overlap = previous_track, overlap
+            if best_track is None:
+                best_track = {"name": None, "encoded": 0}
+            else:
+                previous_tracks.remove(best_track)
+            best_track["location"] = found_face
+            tracks.append(best_track)
+        self.tracks = tracks
+        return tracks
+
+"""
+Face detection worker processes structure. Frames are copied into shared memory slots, so workers only receive the slot name.
+"""
+
+class FaceWorkers:
+
+    """
+    Constructs face detection worker processes structure.
+    @param processes: Number of worker processes
+    """
+
+    def __init__(self, processes):
+        self.pool = Pool(processes, initializer=signal, initargs=(SIGINT, SIG_IGN))
+        self.slot_count = processes * 2
+        self.slots = []
+        self.free_slots = deque()
+        self.pending_frames = deque()
+        self.done_frames = []
+
+    """
+    Sends a frame to be detected and encoded by a worker process. If every slot is busy, waits until oldest frame is done and keeps its result for next collect.
+    @param frame: RGB frame
+    @param detection_time: Frame detection time
+    """
+
+    def submit(self, frame, detection_time):
+        if not self.slots:
+            self.slots = [SharedMemory(create=True, size=frame.nbytes) for _ in range(self.slot_count)]
+            self.free_slots.extend(range(self.slot_count))
+        if not self.free_slots:
+            self.pending_frames[0][2].wait()
+            self.done_frames = self.collect()
+        slot = self.free_slots.popleft()
+        ndarray(frame.shape, dtype=uint8, buffer=self.slots[slot].buf)[:] = frame
+        self.pending_frames.append((slot, detection_time, self.pool.apply_async(detect_faces, (self.slots[slot].name, frame.shape))))
+
+    """
+    Collects done frames in the order they were submitted.
+    @returns: A list with found faces locations, found faces encodings and detection time for each done frame
+    """
+
+    def collect(self):
+        done_frames, self.done_frames = self.done_frames, []
+        while self.pending_frames and self.pending_frames[0][2].ready():
+            slot, detection_time, result = self.pending_frames.popleft()
+            self.free_slots.append(slot)
+            found_faces, encoded_found_faces = result.get()
+            done_frames.append((found_faces, encoded_found_faces, detection_time))
+        return done_frames
+
+    """
+    Stops worker processes and releases shared memory slots. Slots already removed are ignored.
+    """
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        for slot in self.slots:
+            slot.close()
+            try:
+                slot.unlink()
+            except FileNotFoundError:
+                pass
+
+"""
+Shared memory slots attached by a face detection worker process.
+"""
+
+attached_slots = {}
+
+"""
+Detects and encodes faces of a frame stored in shared memory. Runs in a face detection worker process. Attached slots are unregistered from the worker resource tracker, as they are owned and unlinked by the main process.
+@param slot_name: Shared memory slot name
+@param frame_shape: Frame shape
+@returns: A tuple with found faces locations and found faces encodings
+"""
+
+def detect_faces(slot_name, frame_shape):
+    if slot_name not in attached_slots:
+        attached_slots[slot_name] = SharedMemory(name=slot_name)
+        resource_tracker.unregister(attached_slots[slot_name]._name, "shared_memory")
+    frame = ndarray(frame_shape, dtype=uint8, buffer=attached_slots[slot_name].buf)
+    found_faces = face_locations(frame)
+    return (found_faces, face_encodings(frame, found_faces))
+
+"""
+Calculates intersection over union of two face locations.
+@param location: Face location as top, right, bottom and left
+@param other_location: Other face location as top, right, bottom and left
+@returns: Intersection over union between 0 and 1
+"""
+
+def intersection_over_union(location, other_location):
+    top, right, bottom, left = location
+    other_top, other_right, other_bottom, other_left = other_location
+    intersection = max(0, min(bottom, other_bottom) - max(top, other_top)) * max(0, min(right, other_right) - max(left, other_left))
+    union = (bottom - top) * (right - left) + (other_bottom - other_top) * (other_right - other_left) - intersection
+    if union <= 0:
+        return 0
+    return intersection / union
 
 """
 Executes a command.
@@ -117,21 +769,24 @@ def execute(config_command, language):
     if "command" in config_command:
         command = config_command["command"]
         response = config_command["response"]
-        Popen(command, shell=True)
-        Popen(f"espeak -s 150 \"{response}\" -v {language} >{devnull} 2>&1", shell=True)
+        if not command_executor.submit(command):
+            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Too many commands running{DEFAULT}")
+            return
+        speaker.say(response, language)
         print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Executed: {command}{DEFAULT}")
-    elif "peripheral" in config_command and "subtype" in config_command and "action" in config_command and "room" in config_command and "position" in config_command:
-        peripheral = config_command["peripheral"]
-        subtype = config_command["subtype"]
+    elif "topic" in config_command and "action" in config_command:
         action = config_command["action"]
-        room = config_command["room"]
-        position = config_command["position"]
         response = config_command["response"]
-        hierarchy = path.join(room.lower().replace(" ", "_"), position.lower().replace(" ", "_"), peripheral.lower().replace(" ", "_"))
-        if subtype:
-            hierarchy = path.join(hierarchy, subtype.lower().replace(" ", "_"))
+        hierarchy = config_command["topic"]
+        state = peripheral_states.get(hierarchy) if action == "get" else None
+        if state is not None:
+            speaker.say(response, language)
+            print(f"{hierarchy}: {state[0]}")
+            return
         client.publish(hierarchy, payload=action, qos=1)
-        Popen(f"espeak -s 150 \"{response}\" -v {language} >{devnull} 2>&1", shell=True)
+        if action in ("on", "off"):
+            peripheral_states.update(hierarchy, action)
+        speaker.say(response, language)
         print(f"{GREEN}[{DEFAULT}+{GREEN}]{DEFAULT} {BLUE}Executed: " + hierarchy + (" " + action if action else "") + f"{DEFAULT}")
 
 """
@@ -140,14 +795,13 @@ Executes pending commands user is allowed to.
 """
 
 def execute_pending(name):
+    if not pending_commands.len():
+        return
     permissions = get_user_permissions(name)
-    if permissions and (permissions["privileged"] or not permissions["age_restriction"]):
-            for index in range(pending_commands.len()):
-                pending_command = pending_commands.get(index - 1)
-                if user_allowed(pending_command[0]["age_restriction"], pending_command[0]["privileged"], permissions["age_restriction"], permissions["privileged"]):
-                    pending_commands.remove(index - 1)
-                    info()
-                    execute(pending_command[0], pending_command[1])
+    if permissions:
+        for config_command, language in pending_commands.drain(permission_masks[(permissions["age_restriction"], permissions["privileged"])]):
+            info()
+            execute(config_command, language)
 
 """
 Checks if a command is allowed.
@@ -174,6 +828,43 @@ def user_allowed(command_age_restriction, command_privileged, user_age_restricti
         return True
     return False
 
+"""
+Gets command identity, shared by every phrase and language of the command.
+@param config_command: Command
+@returns: A tuple identifying the command
+"""
+
+def command_key(config_command):
+    if "command" in config_command:
+        return (config_command["command"],)
+    return (config_command["room"], config_command["position"], config_command["peripheral"], config_command["subtype"], config_command["action"])
+
+"""
+Gets command permission class.
+@param age_restriction: Command age restriction
+@param privileged: Command privileged
+@returns: Permission class between 0 and 3
+"""
+
+def permission_class(age_restriction, privileged):
+    return (2 if age_restriction else 0) + (1 if privileged else 0)
+
+"""
+Gets permission classes a user is allowed to.
+@param user_age_restriction: User age restriction
+@param user_privileged: User privileged
+@returns: A mask with a bit set for each allowed permission class
+"""
+
+def permission_mask(user_age_restriction, user_privileged):
+    return sum(1 << permission_class(age_restriction, privileged) for age_restriction in (False, True) for privileged in (False, True) if user_allowed(age_restriction, privileged, user_age_restriction, user_privileged))
+
+"""
+Allowed permission classes mask for each user age restriction and privileged.
+"""
+
+permission_masks = {(user_age_restriction, user_privileged): permission_mask(user_age_restriction, user_privileged) for user_age_restriction in (False, True) for user_privileged in (False, True)}
+
 """
 Launch desired action if is allowed.
 @param phrase: Phrase
@@ -185,13 +876,32 @@ def action(phrase, language):
     if not config_command:
         print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Unexpected phrase recognized{DEFAULT}")
         return
+    if not debouncer.hit(config_command):
+        print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Repeated phrase ignored{DEFAULT}")
+        return
     if permissions(config_command):
         info()
         execute(config_command, language)
     else:
         warning()
-        pending_commands.append(config_command, language)
-        print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Will be executed when it has sufficient permissions{DEFAULT}")
+        if pending_commands.append(config_command, language):
+            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Will be executed when it has sufficient permissions{DEFAULT}")
+        else:
+            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Already waiting for sufficient permissions{DEFAULT}")
+
+"""
+Prints audio chunks lost since last report.
+@param audio_buffer: Audio ring buffer
+@param speech_decoders: Speech decoders
+@param reported: A tuple with overflows and dropped chunks already reported
+@returns: A tuple with overflows and dropped chunks reported
+"""
+
+def report_audio_losses(audio_buffer, speech_decoders, reported):
+    losses = (audio_buffer.overflows, audio_buffer.dropped + sum(speech_decoder.dropped for speech_decoder in speech_decoders))
+    if losses != reported:
+        print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Audio lost: {losses[0]} input overflows, {losses[1]} dropped chunks{DEFAULT}")
+    return losses
 
 """
 Runs speech recognition until stop event is set.
@@ -199,29 +909,101 @@ Runs speech recognition until stop event is set.
 """
 
 def speech_recognition(stop):
-    hmm_path, dic_path, kws_path = language_paths
-    config = Config(lm=None, hmm=path.join(LANGUAGES_PATH, language, hmm_path), dict=path.join(LANGUAGES_PATH, language, dic_path), kws=path.join(LANGUAGES_PATH, language, kws_path), logfn=devnull)
-    decoder = Decoder(config)
-    decoder.start_utt()
+    speech_decoders = [SpeechDecoder(language, language_paths) for language, language_paths in languages_paths.items()]
+    audio_buffer = AudioBuffer(AUDIO_BUFFER_CHUNKS, AUDIO_CHUNK * 2)
+    reported = (0, 0)
+    voice_activity_detector = VoiceActivityDetector()
     with alsa_error():
         audio = PyAudio()
-    stream = audio.open(format=paInt16, channels=1, rate=16000, input=True, frames_per_buffer=1024)
-    print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Listening {language} speech...{DEFAULT}")
+    stream = audio.open(format=paInt16, channels=1, rate=AUDIO_RATE, input=True, frames_per_buffer=AUDIO_CHUNK, stream_callback=audio_buffer.capture)
+    for speech_decoder in speech_decoders:
+        speech_decoder.start()
+        print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Listening {speech_decoder.language} speech...{DEFAULT}")
     while not stop.is_set():
-        buf = stream.read(1024)
-        if buf:
-            decoder.process_raw(buf, False, False)
-            if decoder.hyp() is not None:
-                phrase = decoder.hyp().hypstr.strip()
-                print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}You said: {DEFAULT}{phrase}")
-                action(phrase, language)
-                decoder.end_utt()
-                decoder.start_utt()
-        else:
+        if not stream.is_active():
             print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Cannot process audio...{DEFAULT}")
             break
-    decoder.end_utt()
+        buf = audio_buffer.read(AUDIO_TIMEOUT)
+        if buf:
+            speaking = voice_activity_detector.speaking()
+            chunks = voice_activity_detector.process(buf)
+            if chunks:
+                for speech_decoder in speech_decoders:
+                    speech_decoder.feed(chunks)
+            if speaking and not voice_activity_detector.speaking():
+                for speech_decoder in speech_decoders:
+                    speech_decoder.feed([])
+                reported = report_audio_losses(audio_buffer, speech_decoders, reported)
+    for speech_decoder in speech_decoders:
+        speech_decoder.stop()
+    stream.stop_stream()
     stream.close()
+    audio.terminate()
+    report_audio_losses(audio_buffer, speech_decoders, reported)
+
+"""
+Matches found faces against known faces in a single distance computation.
+@param encoded_faces: Known faces encodings matrix with a row for each user
+@param encoded_found_faces: Found faces encodings
+@returns: A list with the best matching user index for each found face. None for found faces without matches within tolerance
+"""
+
+def match_faces(encoded_faces, encoded_found_faces):
+    if not len(encoded_found_faces):
+        return []
+    distances = norm(array(encoded_found_faces, dtype=float64)[:, newaxis, :] - encoded_faces[newaxis, :, :], axis=2)
+    best_match_indexes = argmin(distances, axis=1)
+    best_match_distances = distances[arange(len(best_match_indexes)), best_match_indexes]
+    return [int(best_match_index) if best_match_distance <= FACE_TOLERANCE else None for best_match_index, best_match_distance in zip(best_match_indexes, best_match_distances)]
+
+"""
+Checks if there is motion between two frames.
+@param reference_frame: Grayscale reference frame
+@param gray_frame: Grayscale frame
+@returns: True if changed area exceeds motion area or there is no reference frame. False if not
+"""
+
+def detect_motion(reference_frame, gray_frame):
+    if reference_frame is None:
+        return True
+    _, changed_pixels = threshold(absdiff(reference_frame, gray_frame), MOTION_PIXEL_THRESHOLD, 255, THRESH_BINARY)
+    return countNonZero(changed_pixels) > MOTION_AREA * changed_pixels.size
+
+"""
+Reads camera frames into latest frame until stop event is set.
+@param camera: Camera
+@param latest_frame: Latest frame
+@param stop: Stop event
+"""
+
+def capture_frames(camera, latest_frame, stop):
+    while not stop.is_set():
+        returned, frame = camera.read()
+        if not returned:
+            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Unable to read camera{DEFAULT}")
+            break
+        latest_frame.put(frame)
+    latest_frame.close()
+
+"""
+Loads recognized users profiles and executes their pending commands.
+@param tracks: Tracked faces
+@param last_user: Last recognized user name
+@returns: Last recognized user name
+"""
+
+def load_profiles(tracks, last_user):
+    for track in tracks:
+        name = track["name"]
+        if name is None:
+            continue
+        if last_user != name:
+            success()
+            print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Loading {name} profile...{DEFAULT}")
+            last_user = name
+            # TODO: Launch every action associated with the user
+        execute_pending(name)
+    return last_user
 
 """
 Runs face recognition until stop event is set.
@@ -229,64 +1011,94 @@ Runs face recognition until stop event is set.
 """
 
 def face_recognition(stop):
-    names, encoded_faces = [], []
-    for user in users:
-        names.append(user["name"])
-        encoded_faces.append(numpy_load(ENCODED_FACES_PATH + user["face"] + ENCODED_FACES_EXTENSION))
-    process_frame = True
+    names = [user["name"] for user in users]
+    encoded_faces = stack([numpy_load(ENCODED_FACES_PATH + user["face"] + ENCODED_FACES_EXTENSION) for user in users]).astype(float64)
     last_user = ""
+    reference_frame = None
+    last_detection = 0
+    face_tracker = FaceTracker()
     camera = VideoCapture(CAP_V4L2)
+    camera.set(CAP_PROP_BUFFERSIZE, 1)
+    latest_frame = LatestFrame()
+    t_capture = Thread(target=capture_frames, args=(camera, latest_frame, stop))
+    t_capture.daemon = True
+    t_capture.start()
     print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Reading faces...{DEFAULT}")
     while not stop.is_set():
-        returned, frame = camera.read()
-        if not returned:
-            camera.release()
-            print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Unable to read camera{DEFAULT}")
-            break
-        if process_frame:
-            rgb_small_frame = resize(frame, (0, 0), fx=0.25, fy=0.25)[:, :, ::-1]
-            found_faces = face_locations(rgb_small_frame)
-            encoded_found_faces = face_encodings(rgb_small_frame, found_faces)
-            for encoded_face in encoded_found_faces:
-                best_match_index = argmin(face_distance(encoded_faces, encoded_face))
-                if compare_faces(encoded_faces, encoded_face)[best_match_index]:
-                    name = names[best_match_index]
-                    if last_user != name:
-                        success()
-                        print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Loading {name} profile...{DEFAULT}")
-                        last_user = name
-                        # TODO: Launch every action associated with the user
-                    execute_pending(name)
-        process_frame = not process_frame
+        frame = latest_frame.get(FRAME_TIMEOUT)
+        if face_workers:
+            for found_faces, encoded_found_faces, detection_time in face_workers.collect():
+                tracks = face_tracker.track(found_faces)
+                for track, best_match_index in zip(tracks, match_faces(encoded_faces, encoded_found_faces)):
+                    track["name"] = names[best_match_index] if best_match_index is not None else None
+                    track["encoded"] = detection_time
+                last_user = load_profiles(tracks, last_user)
+        if frame is None:
+            if latest_frame.closed:
+                break
+            continue
+        small_frame = resize(frame, (0, 0), fx=0.25, fy=0.25)
+        gray_frame = GaussianBlur(cvtColor(small_frame, COLOR_BGR2GRAY), (5, 5), 0)
+        if not detect_motion(reference_frame, gray_frame) and time() - last_detection < MOTION_DETECTION_INTERVAL:
+            continue
+        reference_frame = gray_frame
+        last_detection = time()
+        rgb_small_frame = small_frame[:, :, ::-1]
+        if face_workers:
+            face_workers.submit(rgb_small_frame, last_detection)
+            continue
+        found_faces = face_locations(rgb_small_frame)
+        tracks = face_tracker.track(found_faces)
+        stale_tracks = [track for track in tracks if last_detection - track["encoded"] >= TRACK_ENCODING_INTERVAL]
+        if stale_tracks:
+            encoded_found_faces = face_encodings(rgb_small_frame, [track["location"] for track in stale_tracks])
+            for track, best_match_index in zip(stale_tracks, match_faces(encoded_faces, encoded_found_faces)):
+                track["name"] = names[best_match_index] if best_match_index is not None else None
+                track["encoded"] = last_detection
+        last_user = load_profiles(tracks, last_user)
+    t_capture.join()
     camera.release()
 
 """
-Prints sensor value when requested.
+Gets a peripheral state from a sensor payload.
+@param peripheral: Peripheral
+@param payload: Sensor payload
+@returns: "on" or "off" for peripherals that can be turned on and off, payload for the rest. None if payload is not a valid state
+"""
+
+def peripheral_state(peripheral, payload):
+    if "on" not in (get_peripheral_actions(peripheral) or []):
+        return payload
+    value = telemetry_value(payload)
+    if value is None:
+        return None
+    return "on" if value else "off"
+
+"""
+Prints sensor value when requested, keeps it as last known state and, unless it is a retained value, as telemetry. Messages from topics not belonging to an installed device sensor are ignored.
 """
 
 def on_message(client, userdata, message):
-    print(f"{message.topic}: {message.payload.decode()}")
+    sensor = get_sensor(message.topic)
+    if not sensor:
+        return
+    payload = message.payload.decode()
+    print(f"{message.topic}: {payload}")
+    state = peripheral_state(sensor["peripheral"], payload)
+    if state is not None:
+        peripheral_states.update(message.topic.rsplit("/", 1)[0], state)
+    if not message.retain:
+        telemetry_store.append(sensor, payload)
 
 """
-Subscribes to installed devices peripherals with any sensor function.
+Subscribes to sensor topics of every device through wildcards. Retained sensor values are received right after subscribing.
 @param client: MQTT client
 """
 
 def subscribing(client):
-    for device in get_devices():
-        if device["installed"]:
-            device_path = path.join(device["room"].lower().replace(" ", "_"), device["position"].lower().replace(" ", "_"))
-            for peripheral in get_device_peripherals(device["room"], device["position"]):
-                if "get" in get_peripheral_actions(peripheral):
-                    peripheral_path = path.join(device_path, peripheral.lower().replace(" ", "_"))
-                    subtypes = get_peripheral_subtypes(peripheral)
-                    if subtypes:
-                        for subtype in subtypes:
-                            client.subscribe(path.join(peripheral_path, subtype.lower().replace(" ", "_"), "get"), qos=1)
-                            print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Suscribed to " + path.join(peripheral_path, subtype.lower().replace(" ", "_"), "get") + f"{DEFAULT}")
-                    else:
-                        client.subscribe(path.join(peripheral_path, "get"), qos=1)
-                        print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Suscribed to " + path.join(peripheral_path, "get") + f"{DEFAULT}")
+    for topic in SENSOR_TOPICS:
+        client.subscribe(topic, qos=1)
+        print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Suscribed to {topic}{DEFAULT}")
 
 """
 Connects to MQTT broker.
@@ -317,17 +1129,27 @@ if __name__ == "__main__":
         if not users:
             print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}No users found{DEFAULT}")
             exit()
-        language = get_default_language()
-        language_paths = get_default_language_paths()
-        if not language or not language_paths:
+        languages_paths = get_languages_paths()
+        if not languages_paths:
             print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}No languages found{DEFAULT}")
             exit()
         print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Starting EcoTronix...{DEFAULT}")
-        client, t_face, t_speech, stop = None, None, None, None
+        client, command_executor, face_workers, speaker, telemetry_store, t_face, t_speech, stop = None, None, None, None, None, None, None, None
+        if get_face_workers():
+            face_workers = FaceWorkers(get_face_workers())
+        telemetry_store = TelemetryStore(TELEMETRY_PATH)
+        telemetry_store.start()
+        peripheral_states = PeripheralStates()
         if not start_mqtt():
             print(f"{RED}[{DEFAULT}-{RED}]{DEFAULT} {BLUE}Cannot connect to MQTT broker{DEFAULT}")
             exit()
         pending_commands = PendingCommands()
+        debouncer = Debouncer()
+        command_executor = CommandExecutor(COMMAND_WORKERS)
+        speaker = Speaker()
+        t_warm = Thread(target=speaker.warm, args=(get_responses() or [],))
+        t_warm.daemon = True
+        t_warm.start()
         stop = Event()
         t_face = Thread(target=face_recognition, args=(stop,))
         t_speech = Thread(target=speech_recognition, args=(stop,))
@@ -341,7 +1163,15 @@ if __name__ == "__main__":
             t_speech.join()
         if t_face is not None:
             t_face.join()
+        if face_workers is not None:
+            face_workers.close()
+        if speaker is not None:
+            speaker.stop()
+        if command_executor is not None:
+            command_executor.stop()
         if client is not None:
             client.disconnect()
+        if telemetry_store is not None:
+            telemetry_store.stop()
     print(f"{YELLOW}[{DEFAULT}*{YELLOW}]{DEFAULT} {BLUE}Exiting EcoTronix...{DEFAULT}")
     exit()